@@ -1,19 +1,25 @@
 import cv2
-from deepface import DeepFace
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
 from threading import Thread
 from collections import Counter
 import os
 import subprocess
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
-from mss import mss
-from PIL import Image, ImageTk
-import numpy as np
+from arranque import preparar_ventana
+from calidad import FiltroCalidad
+from graficas import ActualizadorGraficas, GraficoEmociones
+from captura import SesionCaptura, leer_zona
+from motor import MotorEmociones
+from pipeline import PipelineEmociones
+from registro import RegistroRostros, ruta_registro
+from tendencias import EXTENSION_TENDENCIAS, SerieEmociones
+from visor import VisorFotogramas
 
 resultados = Counter()
 
+# Carpeta donde se guarda, por sesión, cada rostro analizado con sus probabilidades (None para no guardarlo)
+carpeta_registros = "Registros"
+
 # Diccionario de traducción de emociones
 emociones_traducidas = {
     "happy": "Feliz",
@@ -28,7 +34,14 @@ emociones_traducidas = {
 class Analizador:
     def __init__(self):
         self.resultados = Counter()  # Usamos un contador específico para cada instancia
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml')
+        # Descarta rostros pequeños, borrosos o mal iluminados antes de clasificarlos
+        self.filtro = FiltroCalidad()
+        # Sesión de captura de pantalla
+        self.sesion = None
+        # Registro por rostro de la sesión en curso
+        self.registro = None
+        # Probabilidades de los últimos rostros, para ver la evolución en sesiones largas
+        self.serie = SerieEmociones()
         self.running = False
         self.ventana = tk.Tk()
         self.ventana.title("Analizador de Emociones")
@@ -38,13 +51,17 @@ class Analizador:
         # Lienzo para mostrar el video
         self.lienzo = tk.Canvas(self.ventana, width=640, height=360, bg="black")
         self.lienzo.pack(pady=10, fill=tk.BOTH, expand=True)
+        # Los hilos de análisis dejan aquí el último fotograma; se pinta desde la interfaz
+        self.visor = VisorFotogramas(self.lienzo)
 
-        # Figura para la gráfica
-        self.figura, self.ax = plt.subplots()
-        self.ax.set_title("Distribución de Emociones Detectadas")
-        self.ax.axis("equal")
-        self.canvas_grafico = FigureCanvasTkAgg(self.figura, master=self.ventana)
-        self.canvas_grafico.get_tk_widget().pack(side=tk.BOTTOM, fill=tk.BOTH, expand=True)
+        # Estado de la carga del modelo, que se hace en segundo plano
+        self.estado = tk.Label(self.ventana, anchor="w")
+        self.estado.pack(side=tk.BOTTOM, fill=tk.X, padx=5)
+
+        # Marco para la gráfica; la figura se crea cuando la ventana ya está visible
+        self.marco_grafico = tk.Frame(self.ventana)
+        self.marco_grafico.pack(side=tk.BOTTOM, fill=tk.BOTH, expand=True)
+        self.figura = None
 
         # Botones
         botones_frame = tk.Frame(self.ventana)
@@ -57,95 +74,110 @@ class Analizador:
 
     def capturar_pantalla(self):
         """Iniciar captura de pantalla y análisis de emociones en tiempo real"""
+        zona = simpledialog.askstring("Analizar Pantalla", "Monitor (1, 2...; 0 para todos) o región x,y,ancho,alto:", initialvalue="1")
+        if not zona:
+            return
+        try:
+            zona = leer_zona(zona)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
         self.resultados.clear()  # Limpiar los resultados previos
+        self.filtro.reiniciar()
+        # Al abrir el registro se cierra el anterior, que guarda las tendencias antes de reiniciarlas
+        self.abrir_registro("pantalla")
+        self.serie.reiniciar()
+        # Captura, detección y clasificación corren en el hilo de la sesión; aquí sólo se dibuja
+        self.sesion = SesionCaptura(self._al_capturar, zona, filtro=self.filtro)
+        self.sesion.iniciar()
         self.running = True
-        self._captura_pantalla()  # Llamamos a la función de captura
-
-    def _captura_pantalla(self):
-        """Función de captura de pantalla que se ejecuta en un ciclo"""
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml')
-        with mss() as sct:
-            monitor = sct.monitors[0]  # Captura toda la pantalla
-
-            # Captura un fotograma de la pantalla
-            frame = np.array(sct.grab(monitor))
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)  # Convertir a BGR
-
-            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            rgb_frame = cv2.cvtColor(gray_frame, cv2.COLOR_GRAY2RGB)
 
-            faces = face_cascade.detectMultiScale(gray_frame, scaleFactor=1.2, minNeighbors=7)
+    def _al_capturar(self, indice, tiempo, frame, detecciones):
+        """Cuenta, registra y dibuja las emociones de una captura (se llama desde el hilo de la sesión)"""
+        registro = self.registro
+        self.serie.agregar_lote([probabilidades for _, _, probabilidades in detecciones])
+        for (x, y, w, h), emotion, probabilidades in detecciones:
+            if registro is not None:
+                registro.agregar(indice, tiempo, (x, y, w, h), probabilidades)
+            emocion_es = emociones_traducidas.get(emotion, emotion)
+            self.resultados[emocion_es] += 1
 
-            for (x, y, w, h) in faces:
-                face_roi = rgb_frame[y:y + h, x:x + w]
+            # Parámetros de fuente
+            font_scale = 2  # Escala del texto
+            font_thickness = 2  # Grosor del texto
+            margin = 5  # Margen opcional alrededor del texto
 
-                try:
-                    result = DeepFace.analyze(face_roi, actions=['emotion'], enforce_detection=False)
-                    emotion = result[0]['dominant_emotion']
-                    emocion_es = emociones_traducidas.get(emotion, emotion)
-                    self.resultados[emocion_es] += 1
+            # Obtener dimensiones del texto
+            (text_width, text_height), baseline = cv2.getTextSize(emocion_es, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness)
 
-                    # Parámetros de fuente
-                    font_scale = 2  # Escala del texto
-                    font_thickness = 2  # Grosor del texto
-                    margin = 5  # Margen opcional alrededor del texto
+            # Coordenadas del cuadro blanco (ajustando con el margen)
+            top_left = (x, y - text_height - margin)
+            bottom_right = (x + text_width + margin, y)
 
-                    # Obtener dimensiones del texto
-                    (text_width, text_height), baseline = cv2.getTextSize(emocion_es, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness)
+            # Dibujar rectángulo y mostrar emoción traducida
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
 
-                    # Coordenadas del cuadro blanco (ajustando con el margen)
-                    top_left = (x, y - text_height - margin)
-                    bottom_right = (x + text_width + margin, y)
+            # Dibujar el cuadro blanco
+            cv2.rectangle(frame, top_left, bottom_right, (255, 255, 255), -1)
 
-                    # Dibujar rectángulo y mostrar emoción traducida
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            # Dibujar el texto en el cuadro blanco
+            cv2.putText(frame, emocion_es, (x + margin // 2, y - margin), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (71, 75, 78), font_thickness)
 
-                    # Dibujar el cuadro blanco
-                    cv2.rectangle(frame, top_left, bottom_right, (255, 255, 255), -1)
+        self.visor.mostrar(frame)
 
-                    # Dibujar el texto en el cuadro blanco
-                    cv2.putText(frame, emocion_es, (x + margin // 2, y - margin), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (71, 75, 78), font_thickness)
+    def crear_grafico(self):
+        """Crea la figura de la gráfica; matplotlib se importa aquí para no retrasar la ventana."""
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
-                except Exception as e:
-                    print(f"Error en análisis: {e}")
-
-            # Redimensionamos el frame a las dimensiones de la ventana
-            w, h = self.lienzo.winfo_width(), self.lienzo.winfo_height()
-            resized_frame = cv2.resize(frame, (w, h))
-
-            # Mostrar la captura redimensionada en la ventana de Tkinter
-            img = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
-            img = ImageTk.PhotoImage(Image.fromarray(img))
-            self.lienzo.create_image(0, 0, anchor="nw", image=img)
-            self.lienzo.image = img  # Retiene la referencia de la imagen para evitar que se libere
-            
-
-            # Usar after para mantener el ciclo de captura
-            if self.running:
-                self.ventana.after(10, self._captura_pantalla)
+        self.figura, self.ax = plt.subplots()
+        self.canvas_grafico = FigureCanvasTkAgg(self.figura, master=self.marco_grafico)
+        self.canvas_grafico.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
-            # Actualizar gráfica en tiempo real
-            self.actualizar_grafico()
-            self.ventana.update_idletasks()  # Refrescar la interfaz para que se actualicen los cambios
+        # Los sectores se crean una vez y se refrescan a ritmo fijo sólo si cambian los resultados
+        self.grafico = GraficoEmociones(self.ax, emociones_traducidas.values(), "Distribución de Emociones Detectadas", plt.cm.Pastel1.colors, angulo_inicial=90)
+        self.actualizador = ActualizadorGraficas(self.canvas_grafico, [(self.grafico, self.resultados)])
+        self.actualizador.iniciar()
 
     def actualizar_grafico(self):
         """Actualiza la gráfica de emociones en tiempo real."""
-        self.ax.clear()
-        self.ax.set_title("Distribución de Emociones Detectadas")
-        self.ax.axis("equal")
-        emociones = {emociones_traducidas.get(k, k): v for k, v in self.resultados.items()}
-        if emociones:
-            self.ax.pie(
-                emociones.values(), 
-                labels=emociones.keys(), 
-                autopct='%1.1f%%', 
-                colors=plt.cm.Pastel1.colors, 
-                startangle=90
-            )
-        self.canvas_grafico.draw()
+        if self.figura is None:
+            return
+        self.actualizador.actualizar()
+
+    def abrir_registro(self, fuente):
+        """Empieza el registro por rostro de una sesión nueva"""
+        self.cerrar_registro()
+        if carpeta_registros:
+            try:
+                self.registro = RegistroRostros(ruta_registro(carpeta_registros, fuente), fuente)
+            except OSError as e:
+                print(f"Error al crear el registro de rostros: {e}")
+
+    def cerrar_registro(self):
+        # Lo pueden cerrar a la vez el botón Detener y el final del video
+        registro, self.registro = self.registro, None
+        if registro is not None:
+            registro.cerrar()
+            print(f"Registro de rostros guardado en {registro.ruta}")
+            self.guardar_tendencias(registro.ruta)
+
+    def guardar_tendencias(self, ruta):
+        """Guarda junto al registro de la sesión las distribuciones de los últimos minutos"""
+        try:
+            self.serie.guardar_json(os.path.splitext(ruta)[0] + EXTENSION_TENDENCIAS)
+        except OSError as e:
+            print(f"Error al guardar las tendencias: {e}")
 
     def mostrar_resumen(self):
         """Mostrar el resumen de las emociones"""
+        import matplotlib.pyplot as plt
+
+        print(self.filtro.resumen())
+        print(self.serie.resumen())
+        if self.sesion is not None:
+            print(self.sesion.resumen())
         emociones_es = {emociones_traducidas.get(emocion, emocion): cantidad for emocion, cantidad in self.resultados.items()}
 
         plt.figure(figsize=(8, 8))
@@ -182,62 +214,44 @@ class Analizador:
     def analizar_video(self, fuente, archivo_descargado=None):
         """Analiza un video y detecta emociones en tiempo real"""
         self.resultados.clear()  # Limpiar los resultados antes de iniciar el análisis
-        cap = cv2.VideoCapture(fuente)
-        self.cap = cap  # Guardamos la referencia del VideoCapture para cerrarlo después
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            frame = cv2.resize(frame, (640, 360))
-            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            rgb_frame = cv2.cvtColor(gray_frame, cv2.COLOR_GRAY2RGB)
-
-            faces = self.face_cascade.detectMultiScale(gray_frame, scaleFactor=1.2, minNeighbors=7)
-
-            for (x, y, w, h) in faces:
-                face_roi = rgb_frame[y:y + h, x:x + w]
-                try:
-                    result = DeepFace.analyze(face_roi, actions=['emotion'], enforce_detection=False)
-                    emotion = result[0]['dominant_emotion']
-                    emocion_es = emociones_traducidas.get(emotion, emotion)
-                    self.resultados[emocion_es] += 1
-                    # Parámetros de fuente
-                    font_scale = 0.5  # Escala del texto
-                    font_thickness = 1  # Grosor del texto
-                    margin = 5  # Margen opcional alrededor del texto
-
-                    # Obtener dimensiones del texto
-                    (text_width, text_height), baseline = cv2.getTextSize(emocion_es, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness)
-
-                    # Coordenadas del cuadro blanco (ajustando con el margen)
-                    top_left = (x, y - text_height - margin)
-                    bottom_right = (x + text_width + margin, y)
-
-                    # Dibujar rectángulo y mostrar emoción traducida
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-
-                    # Dibujar el cuadro blanco
-                    cv2.rectangle(frame, top_left, bottom_right, (255, 255, 255), -1)
-
-                    # Dibujar el texto en el cuadro blanco
-                    cv2.putText(frame, emocion_es, (x + margin // 2, y - margin), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (71, 75, 78), font_thickness)
-                except Exception as e:
-                    print(f"Error en análisis: {e}")
-
-            img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = ImageTk.PhotoImage(Image.fromarray(img))
-            self.lienzo.create_image(0, 0, anchor="nw", image=img)
-            self.lienzo.image = img  # Retiene referencia para evitar que se libere
-            self.ventana.update_idletasks()
-
-            # Actualizar gráfica en tiempo real
-            self.actualizar_grafico()
-            self.ventana.update_idletasks()
-
-        cap.release()
-
+        self.filtro.reiniciar()
+        self.abrir_registro(fuente)
+        self.serie.reiniciar()
+        registro = self.registro
+        # Captura, detección y clasificación corren en hilos separados; aquí sólo se dibuja
+        self.pipeline = PipelineEmociones(MotorEmociones(), fuente, filtro=self.filtro)  # Guardamos la referencia para detenerlo después
+
+        for indice, tiempo, frame, detecciones in self.pipeline:
+            self.serie.agregar_lote([probabilidades for _, _, probabilidades in detecciones])
+            for (x, y, w, h), emotion, probabilidades in detecciones:
+                if registro is not None:
+                    registro.agregar(indice, tiempo, (x, y, w, h), probabilidades)
+                emocion_es = emociones_traducidas.get(emotion, emotion)
+                self.resultados[emocion_es] += 1
+                # Parámetros de fuente
+                font_scale = 0.5  # Escala del texto
+                font_thickness = 1  # Grosor del texto
+                margin = 5  # Margen opcional alrededor del texto
+
+                # Obtener dimensiones del texto
+                (text_width, text_height), baseline = cv2.getTextSize(emocion_es, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness)
+
+                # Coordenadas del cuadro blanco (ajustando con el margen)
+                top_left = (x, y - text_height - margin)
+                bottom_right = (x + text_width + margin, y)
+
+                # Dibujar rectángulo y mostrar emoción traducida
+                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+
+                # Dibujar el cuadro blanco
+                cv2.rectangle(frame, top_left, bottom_right, (255, 255, 255), -1)
+
+                # Dibujar el texto en el cuadro blanco
+                cv2.putText(frame, emocion_es, (x + margin // 2, y - margin), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (71, 75, 78), font_thickness)
+
+            self.visor.mostrar(frame)
+
+        self.cerrar_registro()
         if archivo_descargado:
             self.limpiar_archivo(archivo_descargado)
 
@@ -251,10 +265,14 @@ class Analizador:
 
     def detener(self):
         self.running = False  # Detener análisis de pantalla
+        if self.sesion is not None:
+            self.sesion.detener()
+        self.cerrar_registro()
+        self.actualizar_grafico()
         self.mostrar_resumen()  # Mostrar el resumen de emociones
 
-        if hasattr(self, 'cap') and self.cap.isOpened():
-            self.cap.release()  # Detener el video
+        if hasattr(self, 'pipeline'):
+            self.pipeline.detener()  # Detener el video
             cv2.destroyAllWindows()  # Cerrar cualquier ventana de OpenCV
 
     def limpiar_archivo(self, archivo_descargado):
@@ -268,8 +286,11 @@ class Analizador:
 
     def iniciar(self):
         self.running = True
+        self.visor.iniciar()
+        preparar_ventana(self.ventana, self.estado, self.crear_grafico)
         self.ventana.mainloop()
 
 # Crear y ejecutar el analizador
-analizador = Analizador()
-analizador.iniciar()
+if __name__ == "__main__":
+    analizador = Analizador()
+    analizador.iniciar()
@@ -1,16 +1,21 @@
 import cv2
-from deepface import DeepFace
+import os
+import time
 import tkinter as tk
 from tkinter import filedialog, Toplevel
 from threading import Thread
 from collections import Counter
-import os
-import numpy as np
-import face_recognition
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from PIL import Image, ImageTk
 import warnings
+from arranque import preparar_ventana
+from calidad import FiltroCalidad
+from graficas import ActualizadorGraficas, GraficoEmociones
+from detectores import crear_detector
+from modelos import obtener_clasificador
+from registro import RegistroRostros, ruta_registro
+from seguimiento import SeguidorRostros, CacheIdentidades
+from tendencias import EXTENSION_TENDENCIAS, SerieEmociones
+from banco_clientes import VigilanteBanco
+from visor import VisorFotogramas
 
 # Suprimir las advertencias específicas
 warnings.filterwarnings("ignore", message="Ignoring fixed y limits to fulfill fixed data aspect with adjustable data limits.")
@@ -29,17 +34,43 @@ emociones_traducidas = {
 # Ruta a la base de datos de clientes
 clientes_path = "Clientes"
 
+# Detector de rostros (ver detectores.py); HOG es el de face_recognition
+detector_rostros = "hog"
+
+# La detección se hace sobre el fotograma reducido a este ancho (el coste de HOG crece con los píxeles);
+# las cajas se devuelven a la resolución original para codificar y recortar los rostros
+ancho_deteccion = 960
+
+# Lado mínimo de un rostro que se puede identificar, como fracción del alto del fotograma: 40 píxeles
+# con la cámara de 640x480 y 90 en 1080p. En ambos casos basta una ampliación de HOG (la misma que
+# usaba face_locations por defecto) en lugar de ampliar el fotograma completo dos veces
+fraccion_minima_rostro = 1 / 12
+
+# Refrescos por segundo de las gráficas en vivo (sólo se dibujan si cambiaron los resultados)
+frecuencia_graficas = 2.0
+
+# Carpeta donde se guarda, por sesión, cada rostro analizado con su pista, cliente y probabilidades
+# (None para no guardarlo)
+carpeta_registros = "Registros"
+
 class Analizador:
     def __init__(self):
         self.resultados_clientes = Counter()
         self.resultados_general = Counter()
-        self.rostros_codificados = []
-        self.nombres_clientes = []
         self.running = False
         self.cap = None  
+        self.detector = None
+        # Descarta rostros pequeños, borrosos o mal iluminados antes de clasificar su emoción
+        self.filtro = FiltroCalidad()
+        # Probabilidades de los últimos rostros por cliente, para ver la evolución en sesiones largas
+        self.serie = SerieEmociones()
 
-        # Cargar banco de clientes
-        self.cargar_banco_clientes()
+        # Seguimiento de rostros entre detecciones e identidad resuelta por pista
+        self.seguidor = SeguidorRostros()
+        self.identidades = CacheIdentidades(intervalo_verificacion=90)
+
+        # Banco de clientes, recargado en segundo plano cuando cambia la carpeta
+        self.vigilante = VigilanteBanco(clientes_path)
 
         # Configuración de la interfaz gráfica
         self.ventana = tk.Tk()
@@ -53,6 +84,8 @@ class Analizador:
         # Lienzo para mostrar el video
         self.lienzo = tk.Canvas(video_frame, width=640, height=360, bg="black")
         self.lienzo.pack()
+        # El hilo de análisis deja aquí el último fotograma; se pinta desde la interfaz
+        self.visor = VisorFotogramas(self.lienzo, bgr=False)
 
         # Frame para los botones
         botones_frame = tk.Frame(self.ventana)
@@ -63,70 +96,127 @@ class Analizador:
         tk.Button(botones_frame, text="Seleccionar Video", command=self.seleccionar_video, width=20).grid(row=0, column=1, padx=5, pady=5)
         tk.Button(botones_frame, text="Detener", command=self.detener, width=20, bg="red", fg="white").grid(row=0, column=2, padx=5, pady=5)
 
-        # Frame para las gráficas
-        graficas_frame = tk.Frame(self.ventana)
-        graficas_frame.pack(side=tk.TOP, pady=10, fill=tk.BOTH, expand=True)
+        # Estado de la carga del modelo, que se hace en segundo plano
+        self.estado = tk.Label(self.ventana, anchor="w")
+        self.estado.pack(side=tk.BOTTOM, fill=tk.X, padx=5)
+
+        # Frame para las gráficas; la figura se crea cuando la ventana ya está visible
+        self.graficas_frame = tk.Frame(self.ventana)
+        self.graficas_frame.pack(side=tk.TOP, pady=10, fill=tk.BOTH, expand=True)
+        self.figura = None
+
+    def crear_graficas(self):
+        """Crea las gráficas; matplotlib se importa aquí para no retrasar la ventana."""
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
         # Figura para las gráficas
         self.figura, (self.ax_clientes, self.ax_general) = plt.subplots(1, 2, figsize=(10, 5))
         self.figura.suptitle("Distribución de Emociones Detectadas")
 
-        self.ax_clientes.set_title("Cliente")
-        self.ax_general.set_title("General")
-        self.ax_clientes.axis("equal")
-        self.ax_general.axis("equal")
-
         # Canvas para incrustar la gráfica en la interfaz
-        self.canvas_grafico = FigureCanvasTkAgg(self.figura, master=graficas_frame)
+        self.canvas_grafico = FigureCanvasTkAgg(self.figura, master=self.graficas_frame)
         self.canvas_grafico.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
 
+        # Los sectores se crean una vez y se refrescan a ritmo fijo sólo si cambian los resultados
+        etiquetas = emociones_traducidas.values()
+        self.grafico_clientes = GraficoEmociones(self.ax_clientes, etiquetas, "Cliente", plt.cm.Pastel1.colors)
+        self.grafico_general = GraficoEmociones(self.ax_general, etiquetas, "General", plt.cm.Pastel1.colors)
+        self.actualizador = ActualizadorGraficas(
+            self.canvas_grafico,
+            [(self.grafico_clientes, self.resultados_clientes), (self.grafico_general, self.resultados_general)],
+            frecuencia_graficas,
+        )
+        self.actualizador.iniciar()
+
+    def al_mostrar(self):
+        """Trabajo que se aplaza hasta que la ventana está en pantalla."""
+        self.crear_graficas()
+        self.cargar_banco_clientes()
+
     def cargar_banco_clientes(self):
-        """Cargar las imágenes de los clientes desde las subcarpetas y calcular sus codificaciones."""
-        for carpeta_cliente in os.listdir(clientes_path):
-            ruta_carpeta = os.path.join(clientes_path, carpeta_cliente)
-            if os.path.isdir(ruta_carpeta):  
-                for archivo in os.listdir(ruta_carpeta):
-                    if archivo.endswith(('jpg', 'png', 'jpeg')):
-                        ruta_imagen = os.path.join(ruta_carpeta, archivo)
-                        imagen = face_recognition.load_image_file(ruta_imagen)
-                        codificacion = face_recognition.face_encodings(imagen)
-                        if codificacion:
-                            self.rostros_codificados.append(codificacion[0])
-                            self.nombres_clientes.append(carpeta_cliente)  
+        """Cargar las imágenes de los clientes y seguir vigilando sus subcarpetas mientras se analiza."""
+        self.vigilante.iniciar()
 
     def analizar_video(self, fuente):
         """Analiza un video y detecta emociones y rostros en tiempo real."""
+        import face_recognition
+
+        if self.detector is None:
+            self.detector = crear_detector(detector_rostros, ancho_maximo=ancho_deteccion, fraccion_minima=fraccion_minima_rostro)
         self.resultados_clientes.clear()
         self.resultados_general.clear()
+        self.filtro.reiniciar()
+        self.serie.reiniciar()
         self.running = True  
         self.cap = cv2.VideoCapture(fuente)
+        self.seguidor.reiniciar()
+        self.identidades.reiniciar()
+        indice = 0
+        version_banco = self.vigilante.version
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 0
+        reloj = time.monotonic()
+        registro = None
+        if carpeta_registros:
+            try:
+                registro = RegistroRostros(ruta_registro(carpeta_registros, fuente), fuente)
+            except OSError as e:
+                print(f"Error al crear el registro de rostros: {e}")
 
         while self.cap.isOpened() and self.running:
             ret, frame = self.cap.read()
             if not ret:
                 break
+            tiempo = indice / fps if fps > 0 else time.monotonic() - reloj
 
             # Convertir a RGB antes de procesar (evita el tinte azul)
             rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            ubicaciones_rostros = face_recognition.face_locations(rgb_frame)
-            codificaciones_rostros = face_recognition.face_encodings(rgb_frame, ubicaciones_rostros)
-
-            for codificacion, (top, right, bottom, left) in zip(codificaciones_rostros, ubicaciones_rostros):
-                # Identificar el cliente
-                coincidencias = face_recognition.compare_faces(self.rostros_codificados, codificacion)
-                nombre = "Desconocido"
-
-                if True in coincidencias:
-                    indices = [i for i, coinc in enumerate(coincidencias) if coinc]
-                    mejor_indice = indices[np.argmin(face_recognition.face_distance([self.rostros_codificados[i] for i in indices], codificacion))]
-                    nombre = self.nombres_clientes[mejor_indice]
-
-                roi = rgb_frame[top:bottom, left:right]
+            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+            # Seguir los rostros; el detector sólo se ejecuta cuando toca una detección completa
+            por_clasificar = self.seguidor.actualizar(gray_frame, indice, lambda _: self.detectar_rostros(frame, gray_frame))
+
+            # Si el banco se ha recargado, las identidades resueltas con el anterior ya no valen
+            # (se lee la versión antes que el banco, que se sustituye antes de aumentarla)
+            if self.vigilante.version != version_banco:
+                version_banco = self.vigilante.version
+                self.identidades.invalidar()
+            banco = self.vigilante.banco
+
+            # Codificar sólo los rostros de pistas nuevas o cuya identidad toca volver a verificar
+            por_identificar = self.identidades.pendientes(self.seguidor.pistas, indice)
+            if por_identificar:
+                ubicaciones = [(y, x + w, y + h, x) for (x, y, w, h) in (pista.caja for pista in por_identificar)]
+                codificaciones = face_recognition.face_encodings(rgb_frame, ubicaciones)
+                # Todas las codificaciones del fotograma contra todo el banco en una sola operación
+                for pista, nombre in zip(por_identificar, banco.identificar_lote(codificaciones)):
+                    self.identidades.guardar(pista, nombre, indice)
+
+            # Detectar la emoción de las pistas pendientes en una sola predicción
+            try:
+                # Las pistas con rostros de mala calidad conservan su última emoción
+                aceptadas = set(self.filtro.filtrar(gray_frame, [pista.caja for pista in por_clasificar]))
+                por_clasificar = [pista for pista in por_clasificar if pista.caja in aceptadas]
+                rois = [rgb_frame[y:y + h, x:x + w] for (x, y, w, h) in (pista.caja for pista in por_clasificar)]
+                self.seguidor.asignar(por_clasificar, obtener_clasificador().clasificar_lote(rois), gray_frame, indice)
+            except Exception as e:
+                print(f"Error al analizar emoción: {e}")
+
+            probabilidades, nombres = [], []
+            for pista in self.seguidor.pistas:
+                if pista.emocion is None:
+                    continue
+
+                left, top, w, h = pista.caja
+                right, bottom = left + w, top + h
+                nombre = self.identidades.nombre(pista)
+                if registro is not None:
+                    registro.agregar(indice, tiempo, pista.caja, pista.probabilidades, pista.id, None if nombre == "Desconocido" else nombre)
+                probabilidades.append(pista.probabilidades)
+                nombres.append(nombre)
 
-                # Detectar emoción
                 try:
-                    result = DeepFace.analyze(roi, actions=['emotion'], enforce_detection=False)
-                    emocion = emociones_traducidas.get(result[0]['dominant_emotion'], result[0]['dominant_emotion'])
+                    emocion = emociones_traducidas.get(pista.emocion, pista.emocion)
 
                     # Registrar emoción en el grupo correspondiente
                     if nombre == "Desconocido":
@@ -156,15 +246,26 @@ class Analizador:
                 except Exception as e:
                     print(f"Error al analizar emoción: {e}")
 
-            # Ajustar el video al tamaño del lienzo
-            frame_resized = cv2.resize(rgb_frame, (640, 360))
-            img = ImageTk.PhotoImage(Image.fromarray(frame_resized))
-            self.lienzo.create_image(0, 0, anchor="nw", image=img)
-            self.lienzo.image = img
-            self.actualizar_grafico()
-            self.ventana.update_idletasks()
+            self.serie.agregar_lote(probabilidades, nombres)
+            self.visor.mostrar(rgb_frame)
+            indice += 1
 
         self.cap.release()
+        if registro is not None:
+            registro.cerrar()
+            print(f"Registro de rostros guardado en {registro.ruta}")
+            self.guardar_tendencias(registro.ruta)
+
+    def guardar_tendencias(self, ruta):
+        """Guarda junto al registro de la sesión las distribuciones de los últimos minutos."""
+        try:
+            self.serie.guardar_json(os.path.splitext(ruta)[0] + EXTENSION_TENDENCIAS)
+        except OSError as e:
+            print(f"Error al guardar las tendencias: {e}")
+
+    def detectar_rostros(self, frame, gray_frame):
+        """Detecta rostros con el detector configurado y devuelve cajas (x, y, w, h)."""
+        return self.detector.detectar(frame if self.detector.usa_color else gray_frame)
 
     def detener(self):
         """Detiene el análisis en curso y muestra las gráficas en una ventana emergente."""
@@ -176,6 +277,12 @@ class Analizador:
 
     def mostrar_resumen(self):
         """Muestra una ventana emergente con las gráficas de resumen."""
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        print(self.filtro.resumen())
+        print(self.serie.resumen(por_cliente=True))
+
         ventana_resumen = Toplevel(self.ventana)
         ventana_resumen.title("Resumen de Emociones")
         ventana_resumen.geometry("800x600")
@@ -195,21 +302,9 @@ class Analizador:
 
     def actualizar_grafico(self):
         """Actualiza las gráficas en la interfaz."""
-        self.ax_clientes.clear()
-        self.ax_clientes.set_title("Cliente")
-        self.ax_clientes.axis("equal")
-
-        self.ax_general.clear()
-        self.ax_general.set_title("General")
-        self.ax_general.axis("equal")
-
-        if self.resultados_clientes:
-            self.ax_clientes.pie(self.resultados_clientes.values(), labels=self.resultados_clientes.keys(), autopct='%1.1f%%', colors=plt.cm.Pastel1.colors)
-
-        if self.resultados_general:
-            self.ax_general.pie(self.resultados_general.values(), labels=self.resultados_general.keys(), autopct='%1.1f%%', colors=plt.cm.Pastel1.colors)
-
-        self.canvas_grafico.draw()
+        if self.figura is None:
+            return
+        self.actualizador.actualizar()
 
     def seleccionar_video(self):
         archivo = filedialog.askopenfilename(filetypes=[("Archivos de video", "*.mp4;*.avi")])
@@ -220,10 +315,13 @@ class Analizador:
         Thread(target=self.analizar_video, args=(1,)).start()
 
     def iniciar(self):
+        self.visor.iniciar()
+        preparar_ventana(self.ventana, self.estado, self.al_mostrar)
         self.ventana.mainloop()
 
 
-# Ejecutar la aplicación
-analizador = Analizador()
-analizador.iniciar()
+# Ejecutar la aplicación (la protección es necesaria para los procesos que codifican el banco de clientes)
+if __name__ == "__main__":
+    analizador = Analizador()
+    analizador.iniciar()
 
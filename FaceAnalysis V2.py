@@ -1,19 +1,24 @@
 import cv2
-from deepface import DeepFace
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
 from threading import Thread
 from collections import Counter
-from pytube import YouTube
 import os
 import subprocess
-import matplotlib.pyplot as plt
-from mss import mss
-from PIL import Image, ImageTk
-import numpy as np
+from arranque import preparar_ventana
+from calidad import FiltroCalidad
+from captura import SesionCaptura, leer_zona
+from motor import MotorEmociones
+from pipeline import PipelineEmociones
+from registro import RegistroRostros, ruta_registro
+from tendencias import EXTENSION_TENDENCIAS, SerieEmociones
+from visor import VisorFotogramas
 
 resultados = Counter()
 
+# Carpeta donde se guarda, por sesión, cada rostro analizado con sus probabilidades (None para no guardarlo)
+carpeta_registros = "Registros"
+
 # Diccionario de traducción de emociones
 emociones_traducidas = {
     "happy": "Feliz",
@@ -28,7 +33,14 @@ emociones_traducidas = {
 class Analizador:
     def __init__(self):
         self.resultados = Counter()  # Usamos un contador específico para cada instancia
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml')
+        # Descarta rostros pequeños, borrosos o mal iluminados antes de clasificarlos
+        self.filtro = FiltroCalidad()
+        # Sesión de captura de pantalla
+        self.sesion = None
+        # Registro por rostro de la sesión en curso
+        self.registro = None
+        # Probabilidades de los últimos rostros, para ver la evolución en sesiones largas
+        self.serie = SerieEmociones()
         self.running = False
         self.ventana = tk.Tk()
         self.ventana.title("Analizador de Emociones")
@@ -38,6 +50,8 @@ class Analizador:
         # Lienzo para mostrar el video
         self.lienzo = tk.Canvas(self.ventana, width=640, height=360, bg="black")
         self.lienzo.pack(pady=10, fill=tk.BOTH, expand=True)
+        # Los hilos de análisis dejan aquí el último fotograma; se pinta desde la interfaz
+        self.visor = VisorFotogramas(self.lienzo)
 
         # Botones
         botones_frame = tk.Frame(self.ventana)
@@ -48,60 +62,79 @@ class Analizador:
         tk.Button(botones_frame, text="Analizar Pantalla", command=self.capturar_pantalla, width=20).grid(row=0, column=3, padx=5, pady=5, sticky="ew")
         tk.Button(botones_frame, text="Detener", command=self.detener, width=40, bg="red", fg="white").grid(row=1, column=0, columnspan=4, padx=5, pady=5)
 
+        # Estado de la carga del modelo, que se hace en segundo plano
+        self.estado = tk.Label(self.ventana, anchor="w")
+        self.estado.pack(side=tk.BOTTOM, fill=tk.X, padx=5)
+
     def capturar_pantalla(self):
         """Iniciar captura de pantalla y análisis de emociones en tiempo real"""
+        zona = simpledialog.askstring("Analizar Pantalla", "Monitor (1, 2...; 0 para todos) o región x,y,ancho,alto:", initialvalue="1")
+        if not zona:
+            return
+        try:
+            zona = leer_zona(zona)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
         self.resultados.clear()  # Limpiar los resultados previos
+        self.filtro.reiniciar()
+        # Al abrir el registro se cierra el anterior, que guarda las tendencias antes de reiniciarlas
+        self.abrir_registro("pantalla")
+        self.serie.reiniciar()
+        # Captura, detección y clasificación corren en el hilo de la sesión; aquí sólo se dibuja
+        self.sesion = SesionCaptura(self._al_capturar, zona, filtro=self.filtro)
+        self.sesion.iniciar()
         self.running = True
-        self._captura_pantalla()  # Llamamos a la función de captura
-
-    def _captura_pantalla(self):
-        """Función de captura de pantalla que se ejecuta en un ciclo"""
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml')
-        with mss() as sct:
-            monitor = sct.monitors[0]  # Captura toda la pantalla
-
-            # Captura un fotograma de la pantalla
-            frame = np.array(sct.grab(monitor))
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)  # Convertir a BGR
-
-            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            rgb_frame = cv2.cvtColor(gray_frame, cv2.COLOR_GRAY2RGB)
-
-            faces = face_cascade.detectMultiScale(gray_frame, scaleFactor=1.2, minNeighbors=7)
-
-            for (x, y, w, h) in faces:
-                face_roi = rgb_frame[y:y + h, x:x + w]
 
-                try:
-                    result = DeepFace.analyze(face_roi, actions=['emotion'], enforce_detection=False)
-                    emotion = result[0]['dominant_emotion']
-                    emocion_es = emociones_traducidas.get(emotion, emotion)
-                    self.resultados[emocion_es] += 1
-
-                    # Dibujar rectángulo y mostrar emoción traducida
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    cv2.putText(frame, emocion_es, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-                except Exception as e:
-                    print(f"Error en análisis: {e}")
-
-            # Redimensionamos el frame a las dimensiones de la ventana
-            w, h = self.lienzo.winfo_width(), self.lienzo.winfo_height()
-            resized_frame = cv2.resize(frame, (w, h))
-
-            # Mostrar la captura redimensionada en la ventana de Tkinter
-            img = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
-            img = ImageTk.PhotoImage(Image.fromarray(img))
-            self.lienzo.create_image(0, 0, anchor="nw", image=img)
-            self.lienzo.image = img  # Retiene la referencia de la imagen para evitar que se libere
-
-            # Usar after para mantener el ciclo de captura
-            if self.running:
-                self.ventana.after(10, self._captura_pantalla)
-
-            self.ventana.update_idletasks()  # Refrescar la interfaz para que se actualicen los cambios
+    def _al_capturar(self, indice, tiempo, frame, detecciones):
+        """Cuenta, registra y dibuja las emociones de una captura (se llama desde el hilo de la sesión)"""
+        registro = self.registro
+        self.serie.agregar_lote([probabilidades for _, _, probabilidades in detecciones])
+        for (x, y, w, h), emotion, probabilidades in detecciones:
+            if registro is not None:
+                registro.agregar(indice, tiempo, (x, y, w, h), probabilidades)
+            emocion_es = emociones_traducidas.get(emotion, emotion)
+            self.resultados[emocion_es] += 1
+
+            # Dibujar rectángulo y mostrar emoción traducida
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            cv2.putText(frame, emocion_es, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+
+        self.visor.mostrar(frame)
+
+    def abrir_registro(self, fuente):
+        """Empieza el registro por rostro de una sesión nueva"""
+        self.cerrar_registro()
+        if carpeta_registros:
+            try:
+                self.registro = RegistroRostros(ruta_registro(carpeta_registros, fuente), fuente)
+            except OSError as e:
+                print(f"Error al crear el registro de rostros: {e}")
+
+    def cerrar_registro(self):
+        # Lo pueden cerrar a la vez el botón Detener y el final del video
+        registro, self.registro = self.registro, None
+        if registro is not None:
+            registro.cerrar()
+            print(f"Registro de rostros guardado en {registro.ruta}")
+            self.guardar_tendencias(registro.ruta)
+
+    def guardar_tendencias(self, ruta):
+        """Guarda junto al registro de la sesión las distribuciones de los últimos minutos"""
+        try:
+            self.serie.guardar_json(os.path.splitext(ruta)[0] + EXTENSION_TENDENCIAS)
+        except OSError as e:
+            print(f"Error al guardar las tendencias: {e}")
 
     def mostrar_resumen(self):
         """Mostrar el resumen de las emociones"""
+        import matplotlib.pyplot as plt
+
+        print(self.filtro.resumen())
+        print(self.serie.resumen())
+        if self.sesion is not None:
+            print(self.sesion.resumen())
         emociones_es = {emociones_traducidas.get(emocion, emocion): cantidad for emocion, cantidad in self.resultados.items()}
 
         plt.figure(figsize=(8, 8))
@@ -138,40 +171,26 @@ class Analizador:
     def analizar_video(self, fuente, archivo_descargado=None):
         """Analiza un video y detecta emociones en tiempo real"""
         self.resultados.clear()  # Limpiar los resultados antes de iniciar el análisis
-        cap = cv2.VideoCapture(fuente)
-        self.cap = cap  # Guardamos la referencia del VideoCapture para cerrarlo después
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            frame = cv2.resize(frame, (640, 360))
-            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            rgb_frame = cv2.cvtColor(gray_frame, cv2.COLOR_GRAY2RGB)
-
-            faces = self.face_cascade.detectMultiScale(gray_frame, scaleFactor=1.2, minNeighbors=7)
-
-            for (x, y, w, h) in faces:
-                face_roi = rgb_frame[y:y + h, x:x + w]
-                try:
-                    result = DeepFace.analyze(face_roi, actions=['emotion'], enforce_detection=False)
-                    emotion = result[0]['dominant_emotion']
-                    emocion_es = emociones_traducidas.get(emotion, emotion)
-                    self.resultados[emocion_es] += 1
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    cv2.putText(frame, emocion_es, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-                except Exception as e:
-                    print(f"Error en análisis: {e}")
-
-            img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = ImageTk.PhotoImage(Image.fromarray(img))
-            self.lienzo.create_image(0, 0, anchor="nw", image=img)
-            self.lienzo.image = img  # Retiene referencia para evitar que se libere
-            self.ventana.update_idletasks()
-
-        cap.release()
-
+        self.filtro.reiniciar()
+        self.abrir_registro(fuente)
+        self.serie.reiniciar()
+        registro = self.registro
+        # Captura, detección y clasificación corren en hilos separados; aquí sólo se dibuja
+        self.pipeline = PipelineEmociones(MotorEmociones(), fuente, filtro=self.filtro)  # Guardamos la referencia para detenerlo después
+
+        for indice, tiempo, frame, detecciones in self.pipeline:
+            self.serie.agregar_lote([probabilidades for _, _, probabilidades in detecciones])
+            for (x, y, w, h), emotion, probabilidades in detecciones:
+                if registro is not None:
+                    registro.agregar(indice, tiempo, (x, y, w, h), probabilidades)
+                emocion_es = emociones_traducidas.get(emotion, emotion)
+                self.resultados[emocion_es] += 1
+                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                cv2.putText(frame, emocion_es, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+
+            self.visor.mostrar(frame)
+
+        self.cerrar_registro()
         if archivo_descargado:
             self.limpiar_archivo(archivo_descargado)
 
@@ -185,10 +204,13 @@ class Analizador:
 
     def detener(self):
         self.running = False  # Detener análisis de pantalla
+        if self.sesion is not None:
+            self.sesion.detener()
+        self.cerrar_registro()
         self.mostrar_resumen()  # Mostrar el resumen de emociones
 
-        if hasattr(self, 'cap') and self.cap.isOpened():
-            self.cap.release()  # Detener el video
+        if hasattr(self, 'pipeline'):
+            self.pipeline.detener()  # Detener el video
             cv2.destroyAllWindows()  # Cerrar cualquier ventana de OpenCV
 
     def limpiar_archivo(self, archivo_descargado):
@@ -202,8 +224,11 @@ class Analizador:
 
     def iniciar(self):
         self.running = True
+        self.visor.iniciar()
+        preparar_ventana(self.ventana, self.estado)
         self.ventana.mainloop()
 
 # Crear y ejecutar el analizador
-analizador = Analizador()
-analizador.iniciar()
+if __name__ == "__main__":
+    analizador = Analizador()
+    analizador.iniciar()
@@ -1,15 +1,25 @@
 import cv2
-from deepface import DeepFace
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
 from threading import Thread
 from collections import Counter
-from pytube import YouTube
 import os
 import subprocess
-import matplotlib.pyplot as plt
+from arranque import preparar_ventana
+from calidad import FiltroCalidad
+from motor import MotorEmociones
+from pipeline import PipelineEmociones
+from registro import RegistroRostros, ruta_registro
+from tendencias import EXTENSION_TENDENCIAS, SerieEmociones
 
 resultados = Counter()
+# Descarta los rostros demasiado pequeños, borrosos o mal expuestos antes de clasificarlos
+filtro = FiltroCalidad()
+# Distribuciones de los últimos minutos y medias móviles, para las sesiones largas con la cámara
+serie = SerieEmociones()
+
+# Carpeta donde se guarda, por sesión, cada rostro analizado con sus probabilidades (None para no guardarlo)
+carpeta_registros = "Registros"
 
 def descargar_video(url):
     try:
@@ -33,47 +43,52 @@ emociones_traducidas = {
     "disgust": "Disgusto",
 }
 
+def abrir_registro(fuente):
+    """Empieza el registro por rostro de una sesión; devuelve None si no se guarda"""
+    if not carpeta_registros:
+        return None
+    try:
+        return RegistroRostros(ruta_registro(carpeta_registros, fuente), fuente)
+    except OSError as e:
+        print(f"Error al crear el registro de rostros: {e}")
+        return None
+
 def analizar_video(fuente, archivo_descargado=None):
     global resultados
     resultados.clear()
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml')
-    cap = cv2.VideoCapture(fuente)
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        frame = cv2.resize(frame, (640, 360))
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        rgb_frame = cv2.cvtColor(gray_frame, cv2.COLOR_GRAY2RGB)
-
-        faces = face_cascade.detectMultiScale(gray_frame, scaleFactor=1.2, minNeighbors=7)
-
-        for (x, y, w, h) in faces:
-            face_roi = rgb_frame[y:y + h, x:x + w]
-
-            try:
-                result = DeepFace.analyze(face_roi, actions=['emotion'], enforce_detection=False)
-                emotion = result[0]['dominant_emotion']
-
-                # Traducir emoción detectada al español
-                emocion_es = emociones_traducidas.get(emotion, emotion)
-                resultados[emocion_es] += 1
-
-                # Dibujar rectángulo y mostrar emoción traducida
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                cv2.putText(frame, emocion_es, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-            except Exception as e:
-                print(f"Error en análisis: {e}")
+    filtro.reiniciar()
+    serie.reiniciar()
+    registro = abrir_registro(fuente)
+    # Captura, detección y clasificación corren en hilos separados; aquí sólo se dibuja
+    pipeline = PipelineEmociones(MotorEmociones(), fuente, filtro=filtro)
+
+    for indice, tiempo, frame, detecciones in pipeline:
+        serie.agregar_lote([probabilidades for _, _, probabilidades in detecciones])
+        for (x, y, w, h), emotion, probabilidades in detecciones:
+            if registro is not None:
+                registro.agregar(indice, tiempo, (x, y, w, h), probabilidades)
+            # Traducir emoción detectada al español
+            emocion_es = emociones_traducidas.get(emotion, emotion)
+            resultados[emocion_es] += 1
+
+            # Dibujar rectángulo y mostrar emoción traducida
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            cv2.putText(frame, emocion_es, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
 
         cv2.imshow('Análisis de Emociones', frame)
 
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
-    cap.release()
+    pipeline.detener()
     cv2.destroyAllWindows()
+    if registro is not None:
+        registro.cerrar()
+        print(f"Registro de rostros guardado en {registro.ruta}")
+        try:
+            serie.guardar_json(os.path.splitext(registro.ruta)[0] + EXTENSION_TENDENCIAS)
+        except OSError as e:
+            print(f"Error al guardar las tendencias: {e}")
 
     if archivo_descargado:  # Eliminar el archivo solo si fue descargado
         limpiar_archivo(archivo_descargado)
@@ -82,6 +97,11 @@ def analizar_video(fuente, archivo_descargado=None):
 
 
 def mostrar_resumen():
+    # matplotlib sólo se importa cuando hay que dibujar, para que la ventana aparezca antes
+    import matplotlib.pyplot as plt
+
+    print(filtro.resumen())
+    print(serie.resumen())
     # Crear resumen de emociones
     resumen = "\n".join([f"{emocion}: {cantidad}" for emocion, cantidad in resultados.items()])
     messagebox.showinfo("Resumen de Emociones Detectadas", resumen)
@@ -135,5 +155,8 @@ tk.Button(ventana, text="Usar Cámara", command=usar_camara, width=20).pack(pady
 tk.Button(ventana, text="Seleccionar Video", command=seleccionar_video, width=20).pack(pady=5)
 tk.Button(ventana, text="Procesar YouTube", command=procesar_youtube, width=20).pack(pady=5)
 tk.Button(ventana, text="Salir", command=ventana.quit, width=20).pack(pady=20)
+estado = tk.Label(ventana, anchor="w")
+estado.pack(side=tk.BOTTOM, fill=tk.X, padx=5)
 
+preparar_ventana(ventana, estado)
 ventana.mainloop()
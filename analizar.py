@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+
+from calidad import agregar_opciones_calidad, filtro_desde_argumentos
+from detectores import agregar_opciones_deteccion, configurar_detector_desde_argumentos
+from inferencia import MOTORES
+from modelos import configurar_carpeta_pesos, configurar_motor
+from motor import MotorEmociones, listar_videos
+from muestreo import agregar_opciones_muestreo, muestreador_desde_argumentos
+from seguimiento import agregar_opciones_seguimiento, seguidor_desde_argumentos
+from paralelo import analizar_en_procesos
+from pipeline import analizar_con_pipeline
+from registro import EXTENSION_REGISTRO
+
+
+def guardar_resultado(resultado, carpeta_salida, formato, nombre=None):
+    """Escribe el resultado de un video en JSON, CSV, ambos o registro binario dentro de la carpeta de salida."""
+    nombre = nombre or os.path.splitext(os.path.basename(resultado.fuente))[0]
+    rutas = []
+    if formato in ("json", "ambos"):
+        rutas.append(os.path.join(carpeta_salida, nombre + ".json"))
+        resultado.guardar_json(rutas[-1])
+    if formato in ("csv", "ambos"):
+        rutas.append(os.path.join(carpeta_salida, nombre + ".csv"))
+        resultado.guardar_csv(rutas[-1])
+    if formato == "registro":
+        rutas.append(os.path.join(carpeta_salida, nombre + EXTENSION_REGISTRO))
+        resultado.guardar_registro(rutas[-1])
+    return rutas
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Análisis de emociones en videos sin interfaz gráfica.")
+    parser.add_argument("entradas", nargs="+", help="Archivos de video o carpetas que los contienen")
+    parser.add_argument("-o", "--salida", default="resultados", help="Carpeta donde se guardan los resultados")
+    parser.add_argument("-f", "--formato", choices=["json", "csv", "ambos", "registro"], default="json")
+    parser.add_argument("--lote", type=int, default=1, help="Fotogramas cuyos rostros se clasifican en una sola predicción")
+    parser.add_argument("--procesos", type=int, default=0, help="Procesos entre los que se reparten rangos de fotogramas de cada video (no admite --hilos ni seguimiento)")
+    parser.add_argument("--hilos", type=int, default=0, help="Hilos de detección del pipeline por etapas (0 = análisis secuencial; no admite --lote, muestreo ni seguimiento)")
+    parser.add_argument("--pesos", help="Carpeta local con los pesos del modelo de emociones (sin conexión)")
+    parser.add_argument("--motor", choices=MOTORES, help="Motor de inferencia del modelo de emociones (por defecto, keras)")
+    parser.add_argument("--modelo-onnx", help="Modelo ONNX para los motores onnx y dnn")
+    agregar_opciones_muestreo(parser)
+    agregar_opciones_seguimiento(parser)
+    agregar_opciones_deteccion(parser)
+    agregar_opciones_calidad(parser)
+    return parser
+
+
+def main(argv=None):
+    parser = crear_parser()
+    args = parser.parse_args(argv)
+    if args.procesos > 0:
+        # Cada rango de fotogramas empieza sus pistas desde cero: los identificadores se repetirían
+        incompatibles = [opcion for opcion, usada in (("--hilos", args.hilos > 0), ("--seguimiento", args.seguimiento)) if usada]
+        if incompatibles:
+            parser.error(f"--procesos no admite {', '.join(incompatibles)}")
+    if args.hilos > 0:
+        # El pipeline ya agrupa los rostros de varios fotogramas y analiza todos los fotogramas
+        incompatibles = [opcion for opcion, usada in (("--lote", args.lote != 1), ("--paso", args.paso != 1), ("--frecuencia", args.frecuencia is not None),
+                                                      ("--adaptativo", args.adaptativo), ("--seguimiento", args.seguimiento)) if usada]
+        if incompatibles:
+            parser.error(f"--hilos no admite {', '.join(incompatibles)}")
+    os.makedirs(args.salida, exist_ok=True)
+
+    videos = listar_videos(args.entradas)
+    if not videos:
+        print("No se encontraron videos para analizar.")
+        return 1
+
+    if args.pesos:
+        configurar_carpeta_pesos(args.pesos)
+    if args.motor:
+        configurar_motor(args.motor, args.modelo_onnx)
+    configurar_detector_desde_argumentos(args)
+
+    # Con --procesos cada trabajador carga su propio modelo; el proceso principal no lo necesita
+    motor = None if args.procesos > 0 else MotorEmociones()
+    opciones = {"frames_por_lote": args.lote, "muestreador": muestreador_desde_argumentos(args), "seguidor": seguidor_desde_argumentos(args),
+                "filtro": filtro_desde_argumentos(args)}
+    errores = 0
+    for video in videos:
+        print(f"Analizando {video}...")
+        try:
+            if args.procesos > 0:
+                resultado = analizar_en_procesos(video, args.procesos, **opciones)
+            elif args.hilos > 0:
+                resultado = analizar_con_pipeline(motor, video, args.hilos, opciones["filtro"])
+            else:
+                resultado = motor.analizar(video, **opciones)
+        except IOError as e:
+            print(f"Error al analizar el video: {e}")
+            errores += 1
+            continue
+        guardar_resultado(resultado, args.salida, args.formato)
+        print(json.dumps(resultado.resumen(), ensure_ascii=False))
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
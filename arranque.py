@@ -0,0 +1,85 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from modelos import gestor
+
+# Segundos máximos desde que se lanza un script hasta que su ventana responde
+PRESUPUESTO_ARRANQUE = 2.0
+
+# Con esta variable de entorno la ventana se cierra en cuanto se dibuja, para medir el arranque
+VARIABLE_MEDICION = "ANALISIS_MEDIR_ARRANQUE"
+
+SCRIPTS_INTERFAZ = [
+    "FaceAnalysis.py",
+    "FaceAnalysis V2.py",
+    "Análisis Facial (Versión a compilar exe).py",
+    "Análisis Facial con Reconocimiento Facial.py",
+]
+
+
+def midiendo_arranque():
+    return bool(os.environ.get(VARIABLE_MEDICION))
+
+
+def preparar_ventana(ventana, etiqueta_estado=None, al_mostrar=None):
+    """Llamar justo antes de mainloop: carga el modelo en segundo plano y muestra su estado.
+
+    `al_mostrar` se ejecuta cuando la ventana ya está en pantalla (p. ej. para crear las gráficas).
+    En modo medición no se carga nada y la ventana se cierra en cuanto está lista.
+    """
+    if midiendo_arranque():
+        ventana.after_idle(ventana.destroy)
+        return
+    gestor.cargar_en_segundo_plano()
+    if al_mostrar is not None:
+        ventana.after_idle(al_mostrar)
+    if etiqueta_estado is not None:
+        _mostrar_estado(ventana, etiqueta_estado)
+
+
+def _mostrar_estado(ventana, etiqueta_estado):
+    etiqueta_estado.config(text=gestor.estado)
+    # Se sigue consultando hasta que el modelo termina de cargar (o falla)
+    if not gestor.listo() and not gestor.estado.startswith("Error"):
+        ventana.after(200, _mostrar_estado, ventana, etiqueta_estado)
+
+
+def medir(script, repeticiones=3):
+    """Lanza el script en modo medición y devuelve los segundos que tarda cada arranque."""
+    entorno = dict(os.environ, **{VARIABLE_MEDICION: "1"})
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, script], env=entorno, check=True, stdout=subprocess.DEVNULL)
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el tiempo hasta que cada interfaz muestra su ventana.")
+    parser.add_argument("scripts", nargs="*", default=SCRIPTS_INTERFAZ, help="Scripts a medir (por defecto, todas las interfaces)")
+    parser.add_argument("-n", "--repeticiones", type=int, default=3)
+    parser.add_argument("--presupuesto", type=float, default=PRESUPUESTO_ARRANQUE, help="Segundos permitidos por arranque")
+    args = parser.parse_args(argv)
+
+    excedidos = 0
+    for script in args.scripts:
+        try:
+            tiempos = medir(script, args.repeticiones)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Error al medir {script}: {e}")
+            excedidos += 1
+            continue
+        mediana = statistics.median(tiempos)
+        veredicto = "ok" if mediana <= args.presupuesto else "EXCEDE EL PRESUPUESTO"
+        print(f"{script}: {mediana:.2f} s (mín. {min(tiempos):.2f} s) — {veredicto}")
+        excedidos += mediana > args.presupuesto
+    return 1 if excedidos else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
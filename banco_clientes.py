@@ -0,0 +1,385 @@
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+
+# Distancia máxima para considerar que dos codificaciones son la misma persona (la de compare_faces)
+TOLERANCIA = 0.6
+
+# A partir de este número de codificaciones se usa un índice aproximado si hnswlib está instalado
+UMBRAL_INDICE_APROXIMADO = 10000
+
+EXTENSIONES_IMAGEN = ('jpg', 'png', 'jpeg')
+
+# Caché de codificaciones dentro de la carpeta de clientes: índice, matriz .npy (abierta con mmap) e
+# índice aproximado HNSW de los bancos grandes. Cada escritura crea una matriz con un número nuevo
+# (.codificaciones-N.npy) y el índice pasa a apuntar a ella: la anterior puede seguir mapeada por el
+# banco en uso, y en Windows un archivo mapeado no se puede sustituir ni borrar
+ARCHIVO_INDICE_CACHE = ".codificaciones.json"
+PREFIJO_MATRIZ_CACHE = ".codificaciones-"
+
+DESCONOCIDO = "Desconocido"
+
+# Motivo registrado en la caché para las imágenes en las que no se encuentra ningún rostro
+MOTIVO_SIN_ROSTRO = "sin rostro"
+
+# Segundos entre dos revisiones de la carpeta de clientes mientras se analiza
+INTERVALO_VIGILANCIA = 2.0
+
+# Por debajo de este número de imágenes pendientes se codifican en el proceso principal
+MINIMO_IMAGENES_EN_PARALELO = 8
+
+
+class BancoClientes:
+    """Codificaciones de los clientes en una única matriz contigua, ordenada por cliente.
+
+    Las filas de cada cliente son consecutivas, así que la mejor de sus N fotos se obtiene con
+    una sola reducción (np.minimum.reduceat) sobre la matriz de distancias. Con `ruta_indice`,
+    el índice aproximado se lee de ese archivo si existe y, si no, se guarda en él al crearlo.
+    """
+
+    def __init__(self, codificaciones=None, nombres=None, umbral_indice=UMBRAL_INDICE_APROXIMADO, ruta_indice=None):
+        self.umbral_indice = umbral_indice
+        self.ruta_indice = ruta_indice
+        self._construir(codificaciones if codificaciones is not None else np.empty((0, 128)), nombres or [])
+
+    @classmethod
+    def desde_carpeta(cls, ruta, usar_cache=True, procesos=None, progreso=None, **opciones):
+        """Carga las imágenes de cada subcarpeta de `ruta` (una por cliente) y calcula sus codificaciones.
+
+        Con `usar_cache` sólo se codifican las imágenes nuevas o modificadas (según tamaño y fecha);
+        el resto se lee de la caché en disco. Si no ha cambiado nada, la matriz se usa directamente
+        desde el archivo mapeado en memoria, sin copiarla. Las imágenes pendientes se codifican en
+        `procesos` procesos (por defecto, uno por núcleo) y `progreso(hechas, total, entrada)` se
+        llama al terminar cada una. Las imágenes descartadas quedan en la caché con su "motivo".
+        """
+        entradas_previas, matriz, ruta_matriz = _leer_cache(ruta) if usar_cache else ({}, None, None)
+        entradas = []
+        pendientes = []
+        for cliente, relativa in listar_imagenes(ruta):
+            estado = os.stat(os.path.join(ruta, relativa))
+            entrada = {"ruta": relativa, "cliente": cliente, "tamano": estado.st_size, "mtime": estado.st_mtime_ns, "fila": None}
+            previa = entradas_previas.get(relativa)
+            if previa is not None and previa["cliente"] == cliente and previa["tamano"] == entrada["tamano"] and previa["mtime"] == entrada["mtime"]:
+                # Imagen sin cambios: la codificación (o el motivo de descartarla) ya está en la caché
+                entrada["fila"] = previa["fila"]
+                if "motivo" in previa:
+                    entrada["motivo"] = previa["motivo"]
+            else:
+                pendientes.append(len(entradas))
+            entradas.append(entrada)
+
+        nuevas = {}
+        rutas = [os.path.join(ruta, entradas[i]["ruta"]) for i in pendientes]
+        for hechas, (i, (codificacion, motivo)) in enumerate(zip(pendientes, codificar_imagenes(rutas, procesos)), 1):
+            nuevas[i] = codificacion
+            if motivo is not None:
+                entradas[i]["motivo"] = motivo
+            if progreso is not None:
+                progreso(hechas, len(pendientes), entradas[i])
+
+        codificaciones = []
+        nombres = []
+        filas_reutilizadas = []
+        for i, entrada in enumerate(entradas):
+            if i in nuevas:
+                codificacion = nuevas[i]
+            elif entrada["fila"] is not None:
+                codificacion = matriz[entrada["fila"]]
+                filas_reutilizadas.append(entrada["fila"])
+            else:
+                codificacion = None
+            entrada["fila"] = None
+            if codificacion is not None:
+                entrada["fila"] = len(codificaciones)
+                codificaciones.append(codificacion)
+                nombres.append(entrada["cliente"])
+
+        sin_cambios = (matriz is not None and not pendientes and len(entradas) == len(entradas_previas)
+                       and filas_reutilizadas == list(range(len(matriz))))
+        if sin_cambios:
+            return cls(matriz, nombres, ruta_indice=_ruta_hnsw(ruta_matriz), **opciones)
+
+        matriz = np.array(codificaciones, dtype=np.float32).reshape(-1, 128)
+        if not usar_cache:
+            return cls(matriz, nombres, **opciones)
+        ruta_matriz = _guardar_cache(ruta, matriz, entradas)
+        return cls(matriz, nombres, ruta_indice=_ruta_hnsw(ruta_matriz), **opciones)
+
+    def __len__(self):
+        return len(self.codificaciones)
+
+    def _construir(self, codificaciones, nombres):
+        # Agrupar las filas por cliente para poder reducir por bloques
+        orden = sorted(range(len(nombres)), key=nombres.__getitem__)
+        matriz = np.asarray(codificaciones, dtype=np.float32).reshape(-1, 128)
+        # Si ya viene ordenada (p. ej. desde la caché) no se copia
+        if orden != list(range(len(orden))):
+            matriz = matriz[orden]
+        self.codificaciones = np.ascontiguousarray(matriz)
+        self.nombres = [nombres[i] for i in orden]
+        self.clientes = []
+        inicios = []
+        etiquetas = []
+        for fila, nombre in enumerate(self.nombres):
+            if not self.clientes or self.clientes[-1] != nombre:
+                self.clientes.append(nombre)
+                inicios.append(fila)
+            etiquetas.append(len(self.clientes) - 1)
+        self._inicios = np.array(inicios, dtype=np.intp)
+        self.etiquetas = np.array(etiquetas, dtype=np.intp)
+        self._normas = np.einsum("ij,ij->i", self.codificaciones, self.codificaciones)
+        self._indice = self._crear_indice_aproximado()
+
+    def _crear_indice_aproximado(self):
+        """Crea (o lee de `ruta_indice`) un índice HNSW para bancos grandes; sin hnswlib se sigue con la búsqueda exacta."""
+        if len(self) < self.umbral_indice:
+            return None
+        try:
+            import hnswlib
+        except ImportError:
+            return None
+        indice = hnswlib.Index(space="l2", dim=128)
+        if self.ruta_indice is not None and os.path.exists(self.ruta_indice):
+            # Construirlo cuesta segundos con decenas de miles de codificaciones; leerlo, milisegundos
+            try:
+                indice.load_index(self.ruta_indice, max_elements=len(self))
+                if indice.get_current_count() == len(self):
+                    indice.set_ef(64)
+                    return indice
+            except (OSError, RuntimeError) as e:
+                print(f"Error al leer el índice aproximado: {e}")
+            indice = hnswlib.Index(space="l2", dim=128)
+        indice.init_index(max_elements=len(self), ef_construction=200, M=16)
+        indice.add_items(self.codificaciones, np.arange(len(self)))
+        indice.set_ef(64)
+        if self.ruta_indice is not None:
+            try:
+                indice.save_index(self.ruta_indice)
+            except (OSError, RuntimeError) as e:
+                print(f"Error al guardar el índice aproximado: {e}")
+        return indice
+
+    def distancias_por_cliente(self, consultas):
+        """Devuelve una matriz (consultas x clientes) con la distancia a la mejor foto de cada cliente."""
+        consultas = np.asarray(consultas, dtype=np.float32).reshape(-1, 128)
+        # |a - b|² = |a|² + |b|² - 2ab, con una sola multiplicación de matrices para todo el lote
+        cuadrados = np.einsum("ij,ij->i", consultas, consultas)[:, None] + self._normas[None, :] - 2.0 * consultas @ self.codificaciones.T
+        distancias = np.sqrt(np.maximum(cuadrados, 0.0))
+        return np.minimum.reduceat(distancias, self._inicios, axis=1)
+
+    def identificar_lote(self, consultas, tolerancia=TOLERANCIA):
+        """Devuelve el nombre del cliente más cercano a cada codificación, o DESCONOCIDO."""
+        if len(consultas) == 0:
+            return []
+        if len(self) == 0:
+            return [DESCONOCIDO] * len(consultas)
+        if self._indice is not None:
+            return self._identificar_aproximado(consultas, tolerancia)
+
+        distancias = self.distancias_por_cliente(consultas)
+        mejores = np.argmin(distancias, axis=1)
+        minimas = distancias[np.arange(len(mejores)), mejores]
+        return [self.clientes[c] if d <= tolerancia else DESCONOCIDO for c, d in zip(mejores, minimas)]
+
+    def _identificar_aproximado(self, consultas, tolerancia):
+        # El vecino más cercano es ya la mejor foto de su cliente; hnswlib devuelve distancias al cuadrado
+        filas, cuadrados = self._indice.knn_query(np.asarray(consultas, dtype=np.float32).reshape(-1, 128), k=1)
+        return [self.nombres[fila[0]] if cuadrado[0] <= tolerancia ** 2 else DESCONOCIDO for fila, cuadrado in zip(filas, cuadrados)]
+
+
+class VigilanteBanco:
+    """Mantiene un BancoClientes al día con la carpeta de clientes sin detener el análisis.
+
+    Un hilo revisa la carpeta cada `intervalo` segundos comparando tamaño y fecha de las imágenes.
+    Si algo ha cambiado se reconstruye el banco (sólo se codifican las imágenes nuevas o
+    modificadas gracias a la caché) y se sustituye de una vez la referencia `banco`, así que quien
+    lo usa en cada fotograma ve siempre un banco completo, el anterior o el nuevo.
+    """
+
+    def __init__(self, ruta, intervalo=INTERVALO_VIGILANCIA, procesos=None, **opciones):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.procesos = procesos
+        # Opciones para BancoClientes (umbral_indice)
+        self.opciones = opciones
+        self.banco = BancoClientes(**opciones)
+        # Aumenta con cada recarga para que quien guarde identidades sepa cuándo invalidarlas
+        self.version = 0
+        self._huella = None
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        """Carga el banco y empieza a vigilar la carpeta en segundo plano."""
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._vigilar, daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._parar.set()
+
+    def revisar(self):
+        """Recarga el banco si la carpeta ha cambiado; devuelve True si se ha sustituido."""
+        huella = huella_carpeta(self.ruta)
+        if huella == self._huella:
+            return False
+        if huella:
+            banco = BancoClientes.desde_carpeta(self.ruta, procesos=self.procesos, **self.opciones)
+        else:
+            banco = BancoClientes(**self.opciones)
+        # Una sola asignación: los lectores nunca ven un banco a medio construir
+        self.banco = banco
+        self._huella = huella
+        self.version += 1
+        return True
+
+    def _vigilar(self):
+        while not self._parar.is_set():
+            try:
+                if self.revisar():
+                    print(f"Banco de clientes actualizado: {len(self.banco)} codificaciones de {len(self.banco.clientes)} clientes.")
+            except Exception as e:
+                # Se sigue usando el banco anterior y se reintenta en la próxima revisión
+                print(f"Error al recargar el banco de clientes: {e}")
+            self._parar.wait(self.intervalo)
+
+
+def listar_imagenes(ruta):
+    """Devuelve [(cliente, ruta relativa)] de las imágenes de cada subcarpeta, en orden de cliente."""
+    imagenes = []
+    for carpeta_cliente in sorted(os.listdir(ruta)):
+        ruta_carpeta = os.path.join(ruta, carpeta_cliente)
+        if os.path.isdir(ruta_carpeta):
+            for archivo in sorted(os.listdir(ruta_carpeta)):
+                if archivo.endswith(EXTENSIONES_IMAGEN):
+                    imagenes.append((carpeta_cliente, os.path.join(carpeta_cliente, archivo)))
+    return imagenes
+
+
+def huella_carpeta(ruta):
+    """Devuelve (ruta relativa, tamaño, fecha) de cada imagen; cambia si se añade, modifica o borra alguna."""
+    if not os.path.isdir(ruta):
+        return ()
+    huella = []
+    for _, relativa in listar_imagenes(ruta):
+        try:
+            estado = os.stat(os.path.join(ruta, relativa))
+        except OSError:
+            # Borrada entre el listado y la consulta; la próxima revisión la verá
+            continue
+        huella.append((relativa, estado.st_size, estado.st_mtime_ns))
+    return tuple(huella)
+
+
+def codificar_imagen(ruta_imagen):
+    """Devuelve la codificación del primer rostro de la imagen, o None si no se encuentra ninguno."""
+    import face_recognition
+
+    codificacion = face_recognition.face_encodings(face_recognition.load_image_file(ruta_imagen))
+    return np.asarray(codificacion[0], dtype=np.float32) if codificacion else None
+
+
+def _codificar_con_motivo(ruta_imagen):
+    """Codifica una imagen en un proceso trabajador; devuelve (codificación o None, motivo o None)."""
+    try:
+        codificacion = codificar_imagen(ruta_imagen)
+    except Exception as e:
+        # Una imagen dañada no debe detener el alta del resto
+        return None, f"error: {e}"
+    return (codificacion, None) if codificacion is not None else (None, MOTIVO_SIN_ROSTRO)
+
+
+def codificar_imagenes(rutas, procesos=None):
+    """Genera (codificación, motivo) de cada imagen, en orden, repartiéndolas entre varios procesos."""
+    procesos = min(procesos or os.cpu_count() or 1, len(rutas))
+    if procesos <= 1 or len(rutas) < MINIMO_IMAGENES_EN_PARALELO:
+        # Para pocas imágenes no compensa arrancar procesos que vuelvan a cargar dlib
+        for ruta_imagen in rutas:
+            yield _codificar_con_motivo(ruta_imagen)
+        return
+
+    contexto = multiprocessing.get_context("spawn")
+    with contexto.Pool(procesos) as pool:
+        # imap conserva el orden y devuelve cada resultado en cuanto está listo
+        yield from pool.imap(_codificar_con_motivo, rutas, chunksize=4)
+
+
+def _ruta_hnsw(ruta_matriz):
+    """Índice aproximado que acompaña a una matriz de la caché."""
+    return os.path.splitext(ruta_matriz)[0] + ".hnsw"
+
+
+def _archivos_cache(ruta):
+    """Matrices e índices aproximados de la caché, también los que quedan de escrituras anteriores."""
+    return [archivo for archivo in os.listdir(ruta) if archivo.startswith(PREFIJO_MATRIZ_CACHE) and archivo.endswith((".npy", ".hnsw"))]
+
+
+def _leer_cache(ruta):
+    """Lee la caché de codificaciones; devuelve ({ruta relativa: entrada}, matriz mapeada, ruta de la matriz) o ({}, None, None)."""
+    try:
+        with open(os.path.join(ruta, ARCHIVO_INDICE_CACHE), encoding="utf-8") as archivo:
+            indice = json.load(archivo)
+        ruta_matriz = os.path.join(ruta, indice["matriz"])
+        matriz = np.load(ruta_matriz, mmap_mode="r")
+    except (OSError, ValueError, KeyError):
+        return {}, None, None
+    # Una matriz que no corresponde al índice (escritura interrumpida) invalida la caché
+    if matriz.shape != (indice["filas"], 128):
+        return {}, None, None
+    return {entrada["ruta"]: entrada for entrada in indice["imagenes"]}, matriz, ruta_matriz
+
+
+def _guardar_cache(ruta, matriz, entradas):
+    """Escribe la matriz en un archivo nuevo y cambia el índice de una vez para que apunte a él; devuelve su ruta."""
+    anteriores = _archivos_cache(ruta)
+    numeros = [int(numero) for numero in (os.path.splitext(archivo)[0][len(PREFIJO_MATRIZ_CACHE):] for archivo in anteriores) if numero.isdigit()]
+    nombre = f"{PREFIJO_MATRIZ_CACHE}{max(numeros, default=0) + 1}.npy"
+    ruta_indice = os.path.join(ruta, ARCHIVO_INDICE_CACHE)
+    with open(os.path.join(ruta, nombre), "wb") as archivo:
+        np.save(archivo, matriz)
+    with open(ruta_indice + ".tmp", "w", encoding="utf-8") as archivo:
+        json.dump({"filas": len(matriz), "matriz": nombre, "imagenes": entradas}, archivo, ensure_ascii=False)
+    os.replace(ruta_indice + ".tmp", ruta_indice)
+
+    for archivo in anteriores:
+        try:
+            os.remove(os.path.join(ruta, archivo))
+        except OSError:
+            # Sigue mapeada por un banco en uso (Windows); se borrará en una escritura posterior
+            pass
+    return os.path.join(ruta, nombre)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconstruye la caché de codificaciones del banco de clientes.")
+    parser.add_argument("ruta", nargs="?", default="Clientes", help="Carpeta con una subcarpeta de imágenes por cliente")
+    parser.add_argument("-p", "--procesos", type=int, default=0, help="Procesos que codifican imágenes (0 = uno por núcleo)")
+    parser.add_argument("--completo", action="store_true", help="Volver a codificar todas las imágenes, no sólo las nuevas o modificadas")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.ruta):
+        print(f"Error al reconstruir el banco de clientes: no existe la carpeta {args.ruta}")
+        return 1
+    if args.completo and os.path.exists(os.path.join(args.ruta, ARCHIVO_INDICE_CACHE)):
+        # Sin índice no se reutiliza nada; las matrices anteriores se borran al escribir la nueva
+        os.remove(os.path.join(args.ruta, ARCHIVO_INDICE_CACHE))
+
+    def progreso(hechas, total, entrada):
+        estado = entrada.get("motivo", "ok")
+        print(f"[{hechas}/{total}] {entrada['ruta']}: {estado}", flush=True)
+
+    banco = BancoClientes.desde_carpeta(args.ruta, procesos=args.procesos or None, progreso=progreso)
+    descartadas = _leer_cache(args.ruta)[0]
+    descartadas = [entrada for entrada in descartadas.values() if "motivo" in entrada]
+    print(f"{len(banco)} codificaciones de {len(banco.clientes)} clientes; {len(descartadas)} imágenes descartadas.")
+    for entrada in descartadas:
+        print(f"  {entrada['ruta']}: {entrada['motivo']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
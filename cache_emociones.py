@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Tamaño de la miniatura de la huella: 9x8 da 64 comparaciones entre píxeles vecinos (dHash)
+TAMANO_HUELLA = (9, 8)
+
+
+def huella_perceptual(roi):
+    """Huella de 64 bits del rostro que no cambia con el tamaño, el brillo ni ligeras variaciones."""
+    gris = roi if roi.ndim == 2 else cv2.cvtColor(roi, cv2.COLOR_RGB2GRAY)
+    miniatura = cv2.resize(gris, TAMANO_HUELLA, interpolation=cv2.INTER_AREA)
+    bits = (miniatura[:, 1:] > miniatura[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class CacheEmociones:
+    """Reutiliza la clasificación de rostros casi idénticos a otros ya clasificados.
+
+    Envuelve un clasificador con la misma interfaz (clasificar_lote). Cada resultado se guarda
+    con la huella perceptual del rostro; un rostro cuya huella difiere en como mucho
+    `distancia_maxima` bits de una guardada recibe ese resultado sin pasar por el modelo.
+    Se guardan como mucho `capacidad` resultados (se descarta el usado hace más tiempo) y
+    cada uno caduca a los `ttl` segundos, para que un rostro que cambia poco a poco se
+    vuelva a clasificar.
+    """
+
+    def __init__(self, clasificador, capacidad=256, distancia_maxima=4, ttl=5.0):
+        self.clasificador = clasificador
+        self.capacidad = capacidad
+        self.distancia_maxima = distancia_maxima
+        self.ttl = ttl
+        self._candado = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Vacía la caché y sus contadores."""
+        self._entradas = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+        self.caducados = 0
+
+    def _buscar(self, huella, ahora):
+        # Un acierto lleva la entrada al final sin renovar su instante, así que el orden de uso no es el
+        # de caducidad: se comprueban todas, que son pocas y de todos modos se recorren al buscar parecidas
+        for caducada in [h for h, (_, instante) in self._entradas.items() if ahora - instante > self.ttl]:
+            del self._entradas[caducada]
+            self.caducados += 1
+
+        if huella in self._entradas:
+            encontrada = huella
+        else:
+            encontrada = self._parecida(huella, reversed(self._entradas))
+        if encontrada is None:
+            return None
+        self._entradas.move_to_end(encontrada)
+        return self._entradas[encontrada][0]
+
+    def _guardar(self, huella, resultado, ahora):
+        self._entradas[huella] = (resultado, ahora)
+        self._entradas.move_to_end(huella)
+        while len(self._entradas) > self.capacidad:
+            self._entradas.popitem(last=False)
+
+    def _parecida(self, huella, huellas):
+        """La de `huellas` más cercana a `huella` si difiere en como mucho `distancia_maxima` bits; a igual distancia, la primera."""
+        distancia, cercana = min(((bin(h ^ huella).count("1"), h) for h in huellas), key=lambda par: par[0], default=(None, None))
+        return cercana if distancia is not None and distancia <= self.distancia_maxima else None
+
+    def clasificar_lote(self, rois):
+        """Como ClasificadorEmociones.clasificar_lote, pero sólo envía al modelo los rostros nuevos."""
+        ahora = time.monotonic()
+        resultados = [None] * len(rois)
+        # Huella de cada rostro que va al modelo -> posiciones del lote que recibirán su resultado
+        pendientes = {}
+        with self._candado:
+            for i, roi in enumerate(rois):
+                if roi is None or roi.size == 0:
+                    continue
+                huella = huella_perceptual(roi)
+                resultado = self._buscar(huella, ahora)
+                if resultado is not None:
+                    resultados[i] = resultado
+                    self.aciertos += 1
+                    continue
+                # Un rostro repetido dentro del mismo lote aprovecha la predicción del primero
+                repetida = huella if huella in pendientes else self._parecida(huella, pendientes)
+                if repetida is None:
+                    pendientes[huella] = [i]
+                    self.fallos += 1
+                else:
+                    pendientes[repetida].append(i)
+                    self.aciertos += 1
+
+        if pendientes:
+            nuevos = self.clasificador.clasificar_lote([rois[posiciones[0]] for posiciones in pendientes.values()])
+            with self._candado:
+                for (huella, posiciones), resultado in zip(pendientes.items(), nuevos):
+                    for i in posiciones:
+                        resultados[i] = resultado
+                    if resultado is not None:
+                        self._guardar(huella, resultado, ahora)
+        return resultados
+
+    def estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+            "caducados": self.caducados,
+            "entradas": len(self._entradas),
+        }
+
+    def resumen(self):
+        e = self.estadisticas()
+        return f"Caché de emociones: {e['tasa_aciertos']:.1%} de aciertos ({e['aciertos']} de {e['aciertos'] + e['fallos']} rostros), {e['entradas']} entradas"
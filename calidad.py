@@ -0,0 +1,109 @@
+import threading
+from collections import Counter
+
+import cv2
+
+# Tamaño al que se lleva cada rostro antes de medirlo, para que las medidas no dependan de su tamaño
+TAMANO_MEDIDA = (64, 64)
+
+# Motivos de descarte
+PEQUENO = "pequeño"
+BORROSO = "borroso"
+OSCURO = "oscuro"
+SOBREEXPUESTO = "sobreexpuesto"
+SIN_CONTRASTE = "sin contraste"
+BAJA_CONFIANZA = "baja confianza"
+
+
+class FiltroCalidad:
+    """Descarta, antes de clasificarlos, los rostros que el modelo de emociones no puede leer bien.
+
+    Comprueba el lado mínimo de la caja, la nitidez (varianza del laplaciano), el brillo medio,
+    el contraste (desviación típica) y, si el detector la da, la confianza de la detección.
+    Cuenta los rostros aceptados y los descartados por cada motivo.
+    """
+
+    def __init__(self, tamano_minimo=40, nitidez_minima=30.0, brillo_minimo=40.0, brillo_maximo=220.0, contraste_minimo=15.0, confianza_minima=None):
+        self.tamano_minimo = tamano_minimo
+        self.nitidez_minima = nitidez_minima
+        self.brillo_minimo = brillo_minimo
+        self.brillo_maximo = brillo_maximo
+        self.contraste_minimo = contraste_minimo
+        self.confianza_minima = confianza_minima
+        self._candado = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.aceptados = 0
+        self.descartes = Counter()
+
+    def __getstate__(self):
+        # El candado no se puede enviar a otros procesos; cada copia crea el suyo
+        estado = self.__dict__.copy()
+        del estado["_candado"]
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._candado = threading.Lock()
+
+    def motivo(self, roi, confianza=None):
+        """Devuelve por qué se descarta el rostro en gris `roi`, o None si se puede clasificar."""
+        alto, ancho = roi.shape[:2]
+        if min(alto, ancho) < self.tamano_minimo:
+            return PEQUENO
+        if self.confianza_minima is not None and confianza is not None and confianza < self.confianza_minima:
+            return BAJA_CONFIANZA
+        muestra = cv2.resize(roi, TAMANO_MEDIDA, interpolation=cv2.INTER_AREA)
+        media, desviacion = cv2.meanStdDev(muestra)
+        if media[0, 0] < self.brillo_minimo:
+            return OSCURO
+        if media[0, 0] > self.brillo_maximo:
+            return SOBREEXPUESTO
+        if desviacion[0, 0] < self.contraste_minimo:
+            return SIN_CONTRASTE
+        if cv2.Laplacian(muestra, cv2.CV_64F).var() < self.nitidez_minima:
+            return BORROSO
+        return None
+
+    def aceptar(self, roi, confianza=None):
+        """Decide si el rostro se clasifica y lo anota en los contadores."""
+        motivo = self.motivo(roi, confianza)
+        with self._candado:
+            if motivo is None:
+                self.aceptados += 1
+            else:
+                self.descartes[motivo] += 1
+        return motivo is None
+
+    def filtrar(self, gray_frame, cajas, confianzas=None):
+        """Devuelve las cajas (x, y, w, h) cuyos rostros superan el filtro."""
+        confianzas = confianzas if confianzas is not None else [None] * len(cajas)
+        return [(x, y, w, h) for (x, y, w, h), confianza in zip(cajas, confianzas)
+                if self.aceptar(gray_frame[y:y + h, x:x + w], confianza)]
+
+    def estadisticas(self):
+        estadisticas = {"rostros_aceptados": self.aceptados}
+        estadisticas.update({f"descartados_{motivo.replace(' ', '_')}": n for motivo, n in self.descartes.items()})
+        return estadisticas
+
+    def resumen(self):
+        """Texto con los rostros aceptados y los descartados por motivo, para mostrar al usuario."""
+        descartes = ", ".join(f"{n} {motivo}" for motivo, n in self.descartes.most_common()) or "ninguno"
+        return f"{self.aceptados} rostros clasificados; descartados: {descartes}"
+
+
+def agregar_opciones_calidad(parser):
+    """Añade a un ArgumentParser las opciones del filtro de calidad de rostros."""
+    grupo = parser.add_argument_group("calidad")
+    grupo.add_argument("--calidad", action="store_true", help="Descartar rostros pequeños, borrosos, oscuros o sin contraste antes de clasificarlos")
+    grupo.add_argument("--tamano-minimo-rostro", type=int, default=40, help="Lado mínimo del rostro en píxeles")
+    grupo.add_argument("--nitidez-minima", type=float, default=30.0, help="Varianza mínima del laplaciano")
+    grupo.add_argument("--confianza-minima", type=float, help="Confianza mínima de la detección (sólo detectores Haar)")
+
+
+def filtro_desde_argumentos(args):
+    """Crea el FiltroCalidad pedido en la línea de comandos, o None si no se filtra."""
+    if not args.calidad:
+        return None
+    return FiltroCalidad(args.tamano_minimo_rostro, args.nitidez_minima, confianza_minima=args.confianza_minima)
@@ -0,0 +1,121 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from cache_emociones import CacheEmociones
+from detectores import crear_detector
+from modelos import obtener_clasificador
+
+# Ancho máximo de la imagen en la que se buscan rostros (las capturas 4K se reducen antes de detectar)
+ANCHO_DETECCION = 1280
+
+# Ancho de la miniatura con la que se comprueba si la pantalla ha cambiado
+ANCHO_MINIATURA = 64
+
+
+def leer_zona(texto):
+    """Convierte "2" en el monitor 2 y "x,y,ancho,alto" en una región; devuelve un entero o un dict de mss."""
+    try:
+        partes = [int(parte) for parte in texto.replace(" ", "").split(",")]
+    except ValueError:
+        partes = []
+    if len(partes) == 1:
+        return partes[0]
+    if len(partes) == 4 and partes[2] > 0 and partes[3] > 0:
+        x, y, ancho, alto = partes
+        return {"left": x, "top": y, "width": ancho, "height": alto}
+    raise ValueError(f"Zona de captura no válida: {texto} (usa un número de monitor o x,y,ancho,alto)")
+
+
+def miniatura(frame):
+    """Versión gris y diminuta del fotograma para compararlo con el anterior sin coste apreciable."""
+    alto, ancho = frame.shape[:2]
+    tamano = (ANCHO_MINIATURA, max(1, round(alto * ANCHO_MINIATURA / ancho)))
+    return cv2.cvtColor(cv2.resize(frame, tamano, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+
+
+class SesionCaptura:
+    """Captura de pantalla continua en un hilo propio, sin bloquear la interfaz.
+
+    Mantiene una única instancia de mss durante toda la sesión y captura sólo `zona`: un número de
+    monitor (1 es el principal, 0 todo el escritorio) o una región {"left", "top", "width", "height"}.
+    Si la diferencia media con el último fotograma analizado no supera `umbral_cambio` niveles de
+    gris, no se vuelve a detectar ni a clasificar y se reutilizan las detecciones anteriores.
+    Por cada captura se llama a `al_analizar(índice, tiempo, frame, [(caja, emoción, probabilidades)])`
+    desde el hilo de la sesión, como los elementos de pipeline.PipelineEmociones.
+    """
+
+    def __init__(self, al_analizar, zona=1, detector=None, filtro=None, umbral_cambio=2.0, fps_maximo=15):
+        self.al_analizar = al_analizar
+        self.zona = zona
+        self.detector = detector or crear_detector(ancho_maximo=ANCHO_DETECCION)
+        self.filtro = filtro
+        self.umbral_cambio = umbral_cambio
+        self.intervalo = 1 / fps_maximo
+        # Se crea al tener el clasificador, dentro del hilo, para no cargar el modelo en la interfaz
+        self.cache = None
+        self.capturas = 0
+        self.sin_cambios = 0
+        self._detenido = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        self._detenido.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detenido.set()
+
+    def _region(self, sct):
+        if isinstance(self.zona, dict):
+            return self.zona
+        if not 0 <= self.zona < len(sct.monitors):
+            raise ValueError(f"No existe el monitor {self.zona} (hay {len(sct.monitors) - 1})")
+        return sct.monitors[self.zona]
+
+    def _ejecutar(self):
+        from mss import mss
+
+        try:
+            self.cache = CacheEmociones(obtener_clasificador())
+            # mss guarda recursos del hilo que lo crea; se abre aquí y se reutiliza en cada captura
+            with mss() as sct:
+                region = self._region(sct)
+                anterior, detecciones = None, []
+                reloj = time.monotonic()
+                while not self._detenido.is_set():
+                    inicio = time.monotonic()
+                    frame = cv2.cvtColor(np.array(sct.grab(region)), cv2.COLOR_BGRA2BGR)
+                    actual = miniatura(frame)
+                    if anterior is not None and cv2.absdiff(actual, anterior).mean() <= self.umbral_cambio:
+                        self.sin_cambios += 1
+                    else:
+                        detecciones = self.analizar(frame)
+                        anterior = actual
+                    self.al_analizar(self.capturas, inicio - reloj, frame, detecciones)
+                    self.capturas += 1
+                    self._detenido.wait(max(0.0, self.intervalo - (time.monotonic() - inicio)))
+        except Exception as e:
+            print(f"Error en la captura de pantalla: {e}")
+
+    def analizar(self, frame):
+        """Detecta y clasifica los rostros de un fotograma; devuelve [(caja, emoción, probabilidades)]."""
+        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self.detector.detectar(frame if self.detector.usa_color else gray_frame)
+        if self.filtro is not None:
+            faces = self.filtro.filtrar(gray_frame, faces)
+        try:
+            clasificaciones = self.cache.clasificar_lote([gray_frame[y:y + h, x:x + w] for (x, y, w, h) in faces])
+        except Exception as e:
+            print(f"Error en análisis: {e}")
+            return []
+        return [(tuple(caja), c[0], c[1]) for caja, c in zip(faces, clasificaciones) if c is not None]
+
+    def resumen(self):
+        texto = f"Capturas de pantalla: {self.capturas}, {self.sin_cambios} sin cambios (no se volvieron a analizar)"
+        if self.cache is not None:
+            texto += f"\n{self.cache.resumen()}"
+        return texto
@@ -0,0 +1,293 @@
+import argparse
+import csv
+import math
+import os
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from seguimiento import iou
+
+# Carpeta del proyecto, donde están los clasificadores Haar incluidos en el repositorio
+CARPETA_PROYECTO = os.path.dirname(os.path.abspath(__file__))
+
+# Detector por defecto y modelo de YuNet (se heredan en los procesos trabajadores)
+VARIABLE_DETECTOR = "ANALISIS_DETECTOR"
+VARIABLE_MODELO_YUNET = "ANALISIS_MODELO_YUNET"
+DETECTOR_POR_DEFECTO = "haar_alt2"
+MODELO_YUNET = "face_detection_yunet_2023mar.onnx"
+
+# Archivo de anotaciones de la carpeta de prueba del banco de pruebas: archivo,x,y,w,h por rostro
+ARCHIVO_ANOTACIONES = "anotaciones.csv"
+EXTENSIONES_IMAGEN = (".jpg", ".jpeg", ".png")
+
+# Lado de la ventana más pequeña que busca el detector HOG de dlib sin ampliar la imagen
+VENTANA_HOG = 80
+
+
+def _a_gris(imagen):
+    return imagen if imagen.ndim == 2 else cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
+
+
+def _a_color(imagen):
+    return cv2.cvtColor(imagen, cv2.COLOR_GRAY2BGR) if imagen.ndim == 2 else imagen
+
+
+def _recortar(cajas, imagen):
+    """Ajusta las cajas (x, y, w, h) a los límites de la imagen y descarta las vacías."""
+    alto, ancho = imagen.shape[:2]
+    ajustadas = []
+    for x, y, w, h in cajas:
+        x0, y0 = max(0, int(x)), max(0, int(y))
+        x1, y1 = min(ancho, int(x + w)), min(alto, int(y + h))
+        if x1 > x0 and y1 > y0:
+            ajustadas.append((x0, y0, x1 - x0, y1 - y0))
+    return ajustadas
+
+
+class DetectorHaar:
+    """Clasificador Haar de OpenCV; usa el XML del repositorio y, si no está, el de OpenCV."""
+
+    usa_color = False
+
+    def __init__(self, archivo="haarcascade_frontalface_alt2.xml", escala=1.2, vecinos=7, tamano_minimo=None):
+        self.archivo = archivo
+        self.escala = escala
+        self.vecinos = vecinos
+        self.tamano_minimo = tamano_minimo
+        ruta = os.path.join(CARPETA_PROYECTO, archivo)
+        self.cascada = cv2.CascadeClassifier(ruta if os.path.exists(ruta) else cv2.data.haarcascades + archivo)
+        if self.cascada.empty():
+            raise IOError(f"No se pudo cargar el clasificador Haar {archivo}")
+
+    def clonar(self):
+        return DetectorHaar(self.archivo, self.escala, self.vecinos, self.tamano_minimo)
+
+    def detectar(self, imagen):
+        minimo = (self.tamano_minimo, self.tamano_minimo) if self.tamano_minimo else None
+        cajas = self.cascada.detectMultiScale(_a_gris(imagen), scaleFactor=self.escala, minNeighbors=self.vecinos, minSize=minimo)
+        return [tuple(int(v) for v in caja) for caja in cajas]
+
+    def detectar_con_confianza(self, imagen):
+        """Como detectar, pero devuelve también el peso de la última etapa de la cascada de cada caja."""
+        minimo = (self.tamano_minimo, self.tamano_minimo) if self.tamano_minimo else None
+        cajas, _, pesos = self.cascada.detectMultiScale3(_a_gris(imagen), scaleFactor=self.escala, minNeighbors=self.vecinos,
+                                                          minSize=minimo, outputRejectLevels=True)
+        return [tuple(int(v) for v in caja) for caja in cajas], np.asarray(pesos, dtype=float).ravel().tolist()
+
+
+class DetectorHOG:
+    """Detector HOG de dlib a través de face_recognition.face_locations.
+
+    Con `tamano_minimo` la imagen sólo se amplía las veces necesarias para encontrar rostros de
+    ese tamaño (la ventana de HOG mide 80 píxeles); si no, se usa `ampliaciones`.
+    """
+
+    usa_color = True
+
+    def __init__(self, ampliaciones=1, tamano_minimo=None):
+        # face_recognition se importa aquí para que los demás detectores no lo necesiten
+        import face_recognition
+
+        self._face_recognition = face_recognition
+        self.ampliaciones = ampliaciones
+        self.tamano_minimo = tamano_minimo
+
+    def clonar(self):
+        return DetectorHOG(self.ampliaciones, self.tamano_minimo)
+
+    def _ampliaciones(self):
+        if not self.tamano_minimo:
+            return self.ampliaciones
+        # Cada ampliación duplica el tamaño de la imagen y multiplica por cuatro el coste
+        return max(0, math.ceil(math.log2(VENTANA_HOG / self.tamano_minimo)))
+
+    def detectar(self, imagen):
+        rgb = cv2.cvtColor(_a_color(imagen), cv2.COLOR_BGR2RGB)
+        ubicaciones = self._face_recognition.face_locations(rgb, number_of_times_to_upsample=self._ampliaciones(), model="hog")
+        return [(left, top, right - left, bottom - top) for (top, right, bottom, left) in ubicaciones]
+
+
+class DetectorYuNet:
+    """Detector YuNet de OpenCV (cv2.FaceDetectorYN), una red pequeña que se ejecuta con cv2.dnn."""
+
+    usa_color = True
+
+    def __init__(self, modelo=None, umbral=0.8, tamano_minimo=None):
+        self.tamano_minimo = tamano_minimo
+        self.modelo = modelo or os.environ.get(VARIABLE_MODELO_YUNET) or os.path.join(CARPETA_PROYECTO, MODELO_YUNET)
+        self.umbral = umbral
+        if not os.path.exists(self.modelo):
+            raise FileNotFoundError(f"No se encuentra el modelo de YuNet en {self.modelo}")
+        self.red = cv2.FaceDetectorYN.create(self.modelo, "", (320, 320), score_threshold=umbral)
+        self._tamano = None
+
+    def clonar(self):
+        return DetectorYuNet(self.modelo, self.umbral, self.tamano_minimo)
+
+    def detectar(self, imagen):
+        imagen = _a_color(imagen)
+        tamano = (imagen.shape[1], imagen.shape[0])
+        if tamano != self._tamano:
+            self.red.setInputSize(tamano)
+            self._tamano = tamano
+        _, caras = self.red.detect(imagen)
+        if caras is None:
+            return []
+        minimo = self.tamano_minimo or 0
+        return [caja for caja in _recortar(caras[:, :4], imagen) if min(caja[2], caja[3]) >= minimo]
+
+
+class DetectorEscalado:
+    """Detecta sobre una copia reducida del fotograma y devuelve las cajas a la resolución original.
+
+    La imagen se reduce por `escala` y, como mucho, a `ancho_maximo` píxeles de ancho. El
+    `tamano_minimo` (en píxeles del fotograma original) se traslada al detector interno a la
+    escala reducida, para que no busque rostros más pequeños de lo que interesa. Con
+    `fraccion_minima` el lado mínimo es esa fracción del alto de cada fotograma, de modo que
+    sirve igual para una cámara de 480p que para un video de 1080p.
+    """
+
+    def __init__(self, detector, escala=1.0, ancho_maximo=None, tamano_minimo=None, fraccion_minima=None):
+        self.detector = detector
+        self.escala = escala
+        self.ancho_maximo = ancho_maximo
+        self.tamano_minimo = tamano_minimo
+        self.fraccion_minima = fraccion_minima
+        self.usa_color = detector.usa_color
+
+    def clonar(self):
+        return DetectorEscalado(self.detector.clonar(), self.escala, self.ancho_maximo, self.tamano_minimo, self.fraccion_minima)
+
+    def factor(self, ancho):
+        factor = self.escala
+        if self.ancho_maximo and ancho * factor > self.ancho_maximo:
+            factor = self.ancho_maximo / ancho
+        return min(1.0, factor)
+
+    def detectar(self, imagen):
+        factor = self.factor(imagen.shape[1])
+        reducida = imagen
+        if factor < 1.0:
+            reducida = cv2.resize(imagen, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+        minimo = self.tamano_minimo or 0
+        if self.fraccion_minima:
+            minimo = max(minimo, self.fraccion_minima * imagen.shape[0])
+        if minimo:
+            self.detector.tamano_minimo = max(1, int(minimo * factor))
+        cajas = [(x / factor, y / factor, w / factor, h / factor) for (x, y, w, h) in self.detector.detectar(reducida)]
+        return [caja for caja in _recortar(cajas, imagen) if min(caja[2], caja[3]) >= minimo]
+
+
+DETECTORES = {
+    "haar_alt2": lambda **opciones: DetectorHaar("haarcascade_frontalface_alt2.xml", **opciones),
+    "haar_default": lambda **opciones: DetectorHaar("haarcascade_frontalface_default.xml", **opciones),
+    "hog": DetectorHOG,
+    "yunet": DetectorYuNet,
+}
+
+
+def crear_detector(nombre=None, escala=1.0, ancho_maximo=None, tamano_minimo=None, fraccion_minima=None, **opciones):
+    """Crea el detector `nombre` (por defecto, el configurado o haar_alt2); todos devuelven cajas (x, y, w, h).
+
+    Con `escala` < 1 o `ancho_maximo` la detección se hace sobre una imagen reducida (ver DetectorEscalado),
+    que también aplica `fraccion_minima`, el lado mínimo de un rostro como fracción del alto del fotograma.
+    """
+    nombre = nombre or os.environ.get(VARIABLE_DETECTOR) or DETECTOR_POR_DEFECTO
+    if nombre not in DETECTORES:
+        raise ValueError(f"Detector desconocido: {nombre}")
+    detector = DETECTORES[nombre](tamano_minimo=tamano_minimo, **opciones)
+    if escala < 1.0 or ancho_maximo or fraccion_minima:
+        return DetectorEscalado(detector, escala, ancho_maximo, tamano_minimo, fraccion_minima)
+    return detector
+
+
+def configurar_detector(nombre, modelo_yunet=None):
+    """Elige el detector en este proceso y en los procesos trabajadores que se creen después."""
+    os.environ[VARIABLE_DETECTOR] = nombre
+    if modelo_yunet:
+        os.environ[VARIABLE_MODELO_YUNET] = modelo_yunet
+
+
+def agregar_opciones_deteccion(parser):
+    """Añade a un ArgumentParser las opciones del detector de rostros."""
+    grupo = parser.add_argument_group("detección")
+    grupo.add_argument("--detector", choices=sorted(DETECTORES), help=f"Detector de rostros (por defecto, {DETECTOR_POR_DEFECTO})")
+    grupo.add_argument("--modelo-yunet", help="Modelo ONNX del detector YuNet")
+
+
+def configurar_detector_desde_argumentos(args):
+    """Aplica el detector pedido en la línea de comandos, si se ha indicado alguno."""
+    if args.detector:
+        configurar_detector(args.detector, args.modelo_yunet)
+
+
+def leer_anotaciones(carpeta):
+    """Devuelve {archivo: [cajas]} de la carpeta de prueba; las imágenes sin rostros tienen lista vacía."""
+    anotaciones = {archivo: [] for archivo in sorted(os.listdir(carpeta)) if archivo.lower().endswith(EXTENSIONES_IMAGEN)}
+    with open(os.path.join(carpeta, ARCHIVO_ANOTACIONES), newline="", encoding="utf-8") as archivo:
+        for fila in csv.DictReader(archivo):
+            anotaciones.setdefault(fila["archivo"], []).append(tuple(int(fila[c]) for c in ("x", "y", "w", "h")))
+    return anotaciones
+
+
+def evaluar(detector, carpeta, anotaciones, umbral_iou=0.5):
+    """Devuelve FPS, sensibilidad (rostros anotados encontrados) y precisión del detector en la carpeta."""
+    imagenes = [(archivo, cv2.imread(os.path.join(carpeta, archivo))) for archivo in anotaciones]
+    imagenes = [(archivo, imagen) for archivo, imagen in imagenes if imagen is not None]
+    totales = defaultdict(int)
+    duracion = 0.0
+    for archivo, imagen in imagenes:
+        # Sólo se cronometra la detección, no la lectura de la imagen
+        inicio = time.perf_counter()
+        cajas = detector.detectar(imagen if detector.usa_color else _a_gris(imagen))
+        duracion += time.perf_counter() - inicio
+
+        esperadas = anotaciones[archivo]
+        usadas = set()
+        for esperada in esperadas:
+            candidatas = [(iou(esperada, caja), j) for j, caja in enumerate(cajas) if j not in usadas]
+            mejor = max(candidatas, default=(0.0, None))
+            if mejor[0] >= umbral_iou:
+                usadas.add(mejor[1])
+                totales["aciertos"] += 1
+        totales["anotadas"] += len(esperadas)
+        totales["detectadas"] += len(cajas)
+
+    return {
+        "imagenes": len(imagenes),
+        "fps": len(imagenes) / duracion if duracion > 0 else 0.0,
+        "sensibilidad": totales["aciertos"] / totales["anotadas"] if totales["anotadas"] else 0.0,
+        "precision": totales["aciertos"] / totales["detectadas"] if totales["detectadas"] else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara la velocidad y la sensibilidad de los detectores de rostros.")
+    parser.add_argument("carpeta", help=f"Carpeta con imágenes y un {ARCHIVO_ANOTACIONES} (archivo,x,y,w,h por rostro)")
+    parser.add_argument("-d", "--detectores", nargs="+", choices=sorted(DETECTORES), default=sorted(DETECTORES))
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU mínima para contar un rostro como encontrado")
+    parser.add_argument("--modelo-yunet", help="Modelo ONNX del detector YuNet")
+    args = parser.parse_args(argv)
+
+    try:
+        anotaciones = leer_anotaciones(args.carpeta)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error al leer las anotaciones: {e}")
+        return 1
+
+    for nombre in args.detectores:
+        try:
+            detector = crear_detector(nombre, **({"modelo": args.modelo_yunet} if nombre == "yunet" and args.modelo_yunet else {}))
+            r = evaluar(detector, args.carpeta, anotaciones, args.iou)
+        except Exception as e:
+            print(f"{nombre}: Error al evaluar el detector: {e}")
+            continue
+        print(f"{nombre}: {r['fps']:.1f} FPS, sensibilidad {r['sensibilidad']:.1%}, precisión {r['precision']:.1%} ({r['imagenes']} imágenes)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,128 @@
+import cv2
+import numpy as np
+
+# Orden de las salidas del modelo de emociones de DeepFace
+ETIQUETAS_EMOCION = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+# Diccionario de traducción de emociones
+emociones_traducidas = {
+    "happy": "Feliz",
+    "sad": "Triste",
+    "angry": "Enojado",
+    "fear": "Miedo",
+    "surprise": "Sorpresa",
+    "neutral": "Neutral",
+    "disgust": "Disgusto",
+}
+
+# Tamaño de entrada del modelo de emociones
+TAMANO_ENTRADA = 48
+
+
+def cargar_modelo_emociones():
+    """Construye el modelo de emociones de DeepFace y devuelve el modelo Keras subyacente."""
+    # DeepFace importa TensorFlow, que tarda varios segundos: sólo se importa cuando hace falta
+    from deepface import DeepFace
+
+    try:
+        modelo = DeepFace.build_model(model_name="Emotion", task="facial_attribute")
+    except TypeError:
+        # Versiones anteriores de DeepFace no aceptan el parámetro task
+        modelo = DeepFace.build_model("Emotion")
+    return getattr(modelo, "model", modelo)
+
+
+def _rellenar_cuadrado(imagen):
+    """Rellena con negro la imagen hasta hacerla cuadrada, como hace DeepFace antes de redimensionar."""
+    alto, ancho = imagen.shape[:2]
+    lado = max(alto, ancho)
+    arriba = (lado - alto) // 2
+    izquierda = (lado - ancho) // 2
+    return cv2.copyMakeBorder(imagen, arriba, lado - alto - arriba, izquierda, lado - ancho - izquierda, cv2.BORDER_CONSTANT, value=0)
+
+
+class ClasificadorEmociones:
+    def __init__(self, modelo=None, redetectar=False):
+        self.modelo = modelo if modelo is not None else cargar_modelo_emociones()
+        # Con redetectar=True se repite la detección y alineación de DeepFace dentro de la ROI
+        self.redetectar = redetectar
+
+    def _redetectar(self, roi):
+        """Vuelve a localizar el rostro dentro de la ROI con el detector de DeepFace."""
+        from deepface import DeepFace
+
+        caras = DeepFace.extract_faces(roi, detector_backend="opencv", enforce_detection=False)
+        return _rellenar_cuadrado((caras[0]["face"] * 255).astype(np.uint8))
+
+    def preparar(self, roi):
+        """Lleva un rostro ya recortado (RGB o gris) a 48x48 en escala de grises."""
+        if self.redetectar:
+            roi = self._redetectar(roi)
+        gris = roi if roi.ndim == 2 else cv2.cvtColor(roi, cv2.COLOR_RGB2GRAY)
+        return cv2.resize(gris, (TAMANO_ENTRADA, TAMANO_ENTRADA), interpolation=cv2.INTER_AREA)
+
+    def probabilidades(self, roi):
+        """Devuelve el vector completo de probabilidades (orden de ETIQUETAS_EMOCION) para una ROI."""
+        resultado = self.clasificar_lote([roi])[0]
+        return None if resultado is None else resultado[1]
+
+    def clasificar_lote(self, rois):
+        """Clasifica todas las ROIs con una sola predicción.
+
+        Devuelve una lista alineada con `rois` con tuplas (emoción dominante, probabilidades),
+        o None para las ROIs vacías o que no se pudieron preparar.
+        """
+        resultados = [None] * len(rois)
+        entradas = []
+        indices = []
+        for i, roi in enumerate(rois):
+            if roi is None or roi.size == 0:
+                continue
+            try:
+                entradas.append(self.preparar(roi))
+                indices.append(i)
+            except Exception as e:
+                print(f"Error al preparar rostro: {e}")
+
+        if not entradas:
+            return resultados
+
+        # Normalización a 0-1 de todo el lote de una vez, con el canal que espera el modelo
+        lote = np.stack(entradas).astype(np.float32)[:, :, :, np.newaxis] / 255.0
+        predicciones = np.asarray(self.modelo.predict_on_batch(lote), dtype=np.float32)
+        predicciones /= predicciones.sum(axis=1, keepdims=True)
+
+        for i, probabilidades in zip(indices, predicciones):
+            resultados[i] = (ETIQUETAS_EMOCION[int(np.argmax(probabilidades))], probabilidades)
+        return resultados
+
+
+class AcumuladorLotes:
+    """Agrupa los rostros de varios fotogramas consecutivos en una única predicción."""
+
+    def __init__(self, clasificador, max_fotogramas=1):
+        self.clasificador = clasificador
+        self.max_fotogramas = max(1, max_fotogramas)
+        self.pendientes = []
+
+    def agregar(self, clave, rois):
+        """Añade los rostros de un fotograma y devuelve los lotes completados como [(clave, resultados)]."""
+        self.pendientes.append((clave, rois))
+        if len(self.pendientes) >= self.max_fotogramas:
+            return self.vaciar()
+        return []
+
+    def vaciar(self):
+        """Clasifica todo lo pendiente y reparte los resultados por fotograma."""
+        if not self.pendientes:
+            return []
+        pendientes, self.pendientes = self.pendientes, []
+        todas = [roi for _, rois in pendientes for roi in rois]
+        resultados = self.clasificador.clasificar_lote(todas)
+
+        salida = []
+        inicio = 0
+        for clave, rois in pendientes:
+            salida.append((clave, resultados[inicio:inicio + len(rois)]))
+            inicio += len(rois)
+        return salida
@@ -0,0 +1,96 @@
+import math
+
+# Distancias al centro de las etiquetas y de los porcentajes (las mismas que usa matplotlib en pie)
+DISTANCIA_ETIQUETA = 1.1
+DISTANCIA_PORCENTAJE = 0.6
+
+# Refrescos por segundo de las gráficas en vivo
+FRECUENCIA_GRAFICAS = 2.0
+
+
+class GraficoEmociones:
+    """Gráfica de sectores de un contador de emociones que se actualiza sin volver a crearla.
+
+    Los sectores, etiquetas y porcentajes de todas las `etiquetas` se crean una sola vez; al
+    actualizar sólo cambian sus ángulos, posiciones y textos, y se ocultan los de las emociones
+    sin datos.
+    """
+
+    def __init__(self, ax, etiquetas, titulo, colores=None, angulo_inicial=0):
+        self.ax = ax
+        self.etiquetas = list(etiquetas)
+        self.angulo_inicial = angulo_inicial
+        ax.set_title(titulo)
+        ax.axis("equal")
+        self.sectores, self.textos, self.porcentajes = ax.pie(
+            [1] * len(self.etiquetas), labels=self.etiquetas, autopct="%1.1f%%", colors=colores, startangle=angulo_inicial
+        )
+        self._valores = None
+        self.actualizar({})
+
+    def actualizar(self, contador):
+        """Ajusta la gráfica a `contador`; devuelve False si no había cambios que dibujar."""
+        valores = [contador.get(etiqueta, 0) for etiqueta in self.etiquetas]
+        if valores == self._valores:
+            return False
+        self._valores = valores
+
+        total = sum(valores)
+        angulo = self.angulo_inicial
+        for sector, texto, porcentaje, valor in zip(self.sectores, self.textos, self.porcentajes, valores):
+            fraccion = valor / total if total else 0.0
+            sector.set_theta1(angulo)
+            sector.set_theta2(angulo + 360 * fraccion)
+
+            medio = math.radians(angulo + 180 * fraccion)
+            x, y = math.cos(medio), math.sin(medio)
+            texto.set_position((DISTANCIA_ETIQUETA * x, DISTANCIA_ETIQUETA * y))
+            texto.set_horizontalalignment("left" if x > 0 else "right")
+            porcentaje.set_position((DISTANCIA_PORCENTAJE * x, DISTANCIA_PORCENTAJE * y))
+            porcentaje.set_text(f"{100 * fraccion:.1f}%")
+
+            for artista in (sector, texto, porcentaje):
+                artista.set_visible(valor > 0)
+            angulo += 360 * fraccion
+        return True
+
+
+class ActualizadorGraficas:
+    """Refresca las gráficas en vivo desde el hilo de Tk, como mucho `frecuencia` veces por segundo.
+
+    `graficas` es una lista de pares (GraficoEmociones, contador). En cada refresco sólo se dibuja
+    el lienzo si algún contador cambió desde el anterior, de modo que el coste de las gráficas no
+    depende de cuántos fotogramas se analicen.
+    """
+
+    def __init__(self, canvas, graficas, frecuencia=FRECUENCIA_GRAFICAS):
+        self.canvas = canvas
+        self.graficas = graficas
+        self.intervalo_ms = max(1, round(1000 / frecuencia))
+        self.redibujados = 0
+        self._programado = None
+
+    def iniciar(self):
+        if self._programado is None:
+            self._refrescar()
+
+    def detener(self):
+        if self._programado is not None:
+            self.canvas.get_tk_widget().after_cancel(self._programado)
+            self._programado = None
+
+    def _refrescar(self):
+        self._programado = self.canvas.get_tk_widget().after(self.intervalo_ms, self._refrescar)
+        self.actualizar()
+
+    def actualizar(self):
+        """Dibuja ahora las gráficas cuyos contadores cambiaron."""
+        try:
+            # Se comprueban todas, sin cortocircuito, para que cada gráfica quede al día
+            cambios = [grafico.actualizar(dict(contador)) for grafico, contador in self.graficas]
+        except RuntimeError:
+            # El hilo de análisis añadió una emoción mientras se copiaba el contador; se verá en el siguiente
+            return
+        if any(cambios):
+            self.canvas.draw_idle()
+            self.redibujados += 1
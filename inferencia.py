@@ -0,0 +1,175 @@
+import argparse
+import os
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+from emociones import TAMANO_ENTRADA, ClasificadorEmociones, cargar_modelo_emociones
+
+# Motores de inferencia del modelo de emociones
+KERAS = "keras"
+ONNX = "onnx"
+DNN = "dnn"
+MOTORES = (KERAS, ONNX, DNN)
+
+ARCHIVO_ONNX = "emociones.onnx"
+ARCHIVO_ONNX_INT8 = "emociones.int8.onnx"
+
+# Coincidencia mínima de etiquetas con Keras para dar por buena una exportación
+COINCIDENCIA_MINIMA = 0.99
+
+
+class ModeloOnnxRuntime:
+    """Modelo de emociones exportado a ONNX ejecutado con ONNX Runtime en CPU."""
+
+    def __init__(self, ruta):
+        import onnxruntime
+
+        self.sesion = onnxruntime.InferenceSession(ruta, providers=["CPUExecutionProvider"])
+        self.entrada = self.sesion.get_inputs()[0].name
+
+    def predict_on_batch(self, lote):
+        return self.sesion.run(None, {self.entrada: np.ascontiguousarray(lote, dtype=np.float32)})[0]
+
+
+class ModeloOpenCVDnn:
+    """Modelo de emociones exportado a ONNX ejecutado con cv2.dnn, sin dependencias nuevas."""
+
+    def __init__(self, ruta):
+        self.red = cv2.dnn.readNetFromONNX(ruta)
+        self.red.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.red.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def predict_on_batch(self, lote):
+        # La entrada conserva el formato del modelo Keras (N, 48, 48, 1)
+        self.red.setInput(np.ascontiguousarray(lote, dtype=np.float32))
+        return self.red.forward()
+
+
+def cargar_modelo(motor=KERAS, ruta_onnx=None):
+    """Devuelve el modelo de emociones del motor pedido; todos exponen predict_on_batch."""
+    if motor == KERAS:
+        return cargar_modelo_emociones()
+    if not ruta_onnx or not os.path.exists(ruta_onnx):
+        raise FileNotFoundError(f"No se encuentra el modelo ONNX de emociones en {ruta_onnx} (expórtalo con 'python inferencia.py exportar')")
+    if motor == ONNX:
+        return ModeloOnnxRuntime(ruta_onnx)
+    if motor == DNN:
+        return ModeloOpenCVDnn(ruta_onnx)
+    raise ValueError(f"Motor de inferencia desconocido: {motor}")
+
+
+def exportar_onnx(ruta, int8=False):
+    """Exporta el modelo Keras de DeepFace a ONNX y, con `int8`, también una versión cuantizada."""
+    import tensorflow as tf
+    import tf2onnx
+
+    modelo = cargar_modelo_emociones()
+    firma = [tf.TensorSpec((None, TAMANO_ENTRADA, TAMANO_ENTRADA, 1), tf.float32, name="entrada")]
+    tf2onnx.convert.from_keras(modelo, input_signature=firma, opset=13, output_path=ruta)
+    rutas = [ruta]
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        # Cuantización dinámica de los pesos; sólo la ejecuta ONNX Runtime, no cv2.dnn
+        ruta_int8 = os.path.join(os.path.dirname(ruta), ARCHIVO_ONNX_INT8)
+        quantize_dynamic(ruta, ruta_int8, weight_type=QuantType.QInt8)
+        rutas.append(ruta_int8)
+    return rutas
+
+
+def rostros_de_muestra(carpeta, limite=None):
+    """Recorta los rostros de las imágenes de una carpeta (o usa la imagen entera si no se detecta ninguno)."""
+    from detectores import crear_detector
+
+    detector = crear_detector("haar_alt2")
+    rostros = []
+    for archivo in sorted(os.listdir(carpeta)):
+        imagen = cv2.imread(os.path.join(carpeta, archivo), cv2.IMREAD_GRAYSCALE)
+        if imagen is None:
+            continue
+        cajas = detector.detectar(imagen)
+        rostros.extend([imagen[y:y + h, x:x + w] for (x, y, w, h) in cajas] or [imagen])
+        if limite and len(rostros) >= limite:
+            break
+    return rostros[:limite] if limite else rostros
+
+
+def comparar(referencia, candidato, rostros):
+    """Devuelve (coincidencia de etiquetas, diferencia máxima de probabilidad) entre dos clasificadores."""
+    esperados = referencia.clasificar_lote(rostros)
+    obtenidos = candidato.clasificar_lote(rostros)
+    pares = [(e, o) for e, o in zip(esperados, obtenidos) if e is not None and o is not None]
+    if not pares:
+        return 0.0, 0.0
+    coincidencia = sum(e[0] == o[0] for e, o in pares) / len(pares)
+    diferencia = max(float(np.abs(e[1] - o[1]).max()) for e, o in pares)
+    return coincidencia, diferencia
+
+
+def medir_latencia(clasificador, rostros, tamano_lote=1, repeticiones=50):
+    """Devuelve la mediana de milisegundos por rostro clasificando lotes de `tamano_lote`."""
+    lote = [rostros[i % len(rostros)] for i in range(tamano_lote)]
+    clasificador.clasificar_lote(lote)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        clasificador.clasificar_lote(lote)
+        tiempos.append((time.perf_counter() - inicio) * 1000 / tamano_lote)
+    return statistics.median(tiempos)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Motores de inferencia alternativos para el modelo de emociones.")
+    ordenes = parser.add_subparsers(dest="orden", required=True)
+
+    exportar = ordenes.add_parser("exportar", help="Exportar el modelo Keras a ONNX")
+    exportar.add_argument("-s", "--salida", default=ARCHIVO_ONNX)
+    exportar.add_argument("--int8", action="store_true", help="Guardar también una versión cuantizada a INT8 (sólo ONNX Runtime)")
+
+    paridad = ordenes.add_parser("paridad", help="Comparar las etiquetas de un motor con las de Keras")
+    paridad.add_argument("imagenes", help="Carpeta con imágenes de rostros")
+    paridad.add_argument("-m", "--motor", choices=[ONNX, DNN], default=DNN)
+    paridad.add_argument("--modelo", default=ARCHIVO_ONNX, help="Modelo ONNX a comparar")
+    paridad.add_argument("--minima", type=float, default=COINCIDENCIA_MINIMA)
+
+    latencia = ordenes.add_parser("latencia", help="Medir milisegundos por rostro de cada motor")
+    latencia.add_argument("imagenes", help="Carpeta con imágenes de rostros")
+    latencia.add_argument("-m", "--motores", nargs="+", choices=MOTORES, default=list(MOTORES))
+    latencia.add_argument("--modelo", default=ARCHIVO_ONNX, help="Modelo ONNX para los motores onnx y dnn")
+    latencia.add_argument("--lotes", type=int, nargs="+", default=[1, 8])
+    latencia.add_argument("-n", "--repeticiones", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    if args.orden == "exportar":
+        for ruta in exportar_onnx(args.salida, args.int8):
+            print(f"Modelo exportado a {ruta}")
+        return 0
+
+    rostros = rostros_de_muestra(args.imagenes)
+    if not rostros:
+        print(f"No se encontraron imágenes en {args.imagenes}")
+        return 1
+
+    if args.orden == "paridad":
+        referencia = ClasificadorEmociones(cargar_modelo(KERAS))
+        candidato = ClasificadorEmociones(cargar_modelo(args.motor, args.modelo))
+        coincidencia, diferencia = comparar(referencia, candidato, rostros)
+        print(f"{len(rostros)} rostros: {coincidencia:.1%} de etiquetas iguales, diferencia máxima de probabilidad {diferencia:.4f}")
+        return 0 if coincidencia >= args.minima else 1
+
+    for motor in args.motores:
+        try:
+            clasificador = ClasificadorEmociones(cargar_modelo(motor, args.modelo))
+        except Exception as e:
+            print(f"{motor}: Error al cargar el modelo: {e}")
+            continue
+        medidas = ", ".join(f"lote {tamano}: {medir_latencia(clasificador, rostros, tamano, args.repeticiones):.2f} ms/rostro" for tamano in args.lotes)
+        print(f"{motor}: {medidas}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,165 @@
+import argparse
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from emociones import TAMANO_ENTRADA, ClasificadorEmociones
+from inferencia import ARCHIVO_ONNX, KERAS, MOTORES, cargar_modelo
+
+# Carpeta local con los pesos, para equipos sin acceso a internet (se hereda en los procesos trabajadores)
+VARIABLE_CARPETA_PESOS = "ANALISIS_CARPETA_PESOS"
+
+# Motor de inferencia (keras, onnx o dnn) y modelo ONNX exportado para los dos últimos
+VARIABLE_MOTOR = "ANALISIS_MOTOR_EMOCIONES"
+VARIABLE_MODELO_ONNX = "ANALISIS_MODELO_ONNX"
+
+# Archivo de pesos que DeepFace descarga para el modelo de emociones
+ARCHIVO_PESOS_EMOCIONES = "facial_expression_model_weights.h5"
+
+# Tamaños de lote con los que se calienta el modelo (un rostro y varios a la vez)
+LOTES_CALENTAMIENTO = (1, 4)
+
+
+def ruta_pesos(carpeta):
+    """Ruta del archivo de pesos dentro de una carpeta con la estructura que espera DeepFace."""
+    return os.path.join(carpeta, ".deepface", "weights", ARCHIVO_PESOS_EMOCIONES)
+
+
+class GestorModelos:
+    """Carga una sola vez el modelo de emociones, lo calienta y lo comparte entre sesiones.
+
+    Con `carpeta_pesos` (o la variable ANALISIS_CARPETA_PESOS) los pesos se leen de esa carpeta
+    y, si faltan, se produce un error en lugar de intentar descargarlos. Con `motor` "onnx" o
+    "dnn" se usa el modelo exportado a ONNX (`ruta_onnx`, por defecto emociones.onnx dentro de
+    la carpeta de pesos) sin cargar TensorFlow.
+    """
+
+    def __init__(self, carpeta_pesos=None, motor=None, ruta_onnx=None):
+        self.carpeta_pesos = carpeta_pesos or os.environ.get(VARIABLE_CARPETA_PESOS)
+        self.motor = motor or os.environ.get(VARIABLE_MOTOR) or KERAS
+        self.ruta_onnx = ruta_onnx or os.environ.get(VARIABLE_MODELO_ONNX)
+        self.tiempos = {}
+        self.estado = "Modelo de emociones sin cargar"
+        self._clasificador = None
+        self._bloqueo = threading.Lock()
+
+    def listo(self):
+        return self._clasificador is not None
+
+    def clasificador(self):
+        """Devuelve el clasificador compartido, cargándolo y calentándolo la primera vez."""
+        if self._clasificador is None:
+            # El hilo de carga y un análisis que empiece antes de que termine no deben cargarlo dos veces
+            with self._bloqueo:
+                if self._clasificador is None:
+                    try:
+                        self._clasificador = self._cargar()
+                    except Exception as e:
+                        self.estado = f"Error al cargar el modelo de emociones: {e}"
+                        raise
+        return self._clasificador
+
+    def cargar_en_segundo_plano(self):
+        """Empieza a cargar el clasificador en un hilo, sin bloquear a quien llama."""
+        def cargar():
+            try:
+                self.clasificador()
+            except Exception as e:
+                print(f"Error al cargar el modelo de emociones: {e}")
+
+        threading.Thread(target=cargar, daemon=True).start()
+
+    def _cargar(self):
+        if self.motor not in MOTORES:
+            raise ValueError(f"Motor de inferencia desconocido: {self.motor}")
+        if self.carpeta_pesos and self.motor == KERAS:
+            ruta = ruta_pesos(self.carpeta_pesos)
+            if not os.path.exists(ruta):
+                raise FileNotFoundError(f"No se encuentran los pesos del modelo de emociones en {ruta}")
+            # DeepFace busca los pesos en $DEEPFACE_HOME/.deepface/weights y no descarga si ya están
+            os.environ["DEEPFACE_HOME"] = os.path.abspath(self.carpeta_pesos)
+
+        ruta_onnx = self.ruta_onnx or os.path.join(self.carpeta_pesos or ".", ARCHIVO_ONNX)
+
+        self.estado = f"Cargando modelo de emociones ({self.motor})..."
+        inicio = time.monotonic()
+        clasificador = ClasificadorEmociones(cargar_modelo(self.motor, ruta_onnx))
+        self.tiempos["carga"] = time.monotonic() - inicio
+
+        self.estado = "Calentando modelo de emociones..."
+        inicio = time.monotonic()
+        calentar(clasificador)
+        self.tiempos["calentamiento"] = time.monotonic() - inicio
+
+        self.estado = f"Modelo de emociones listo ({self.motor}; carga {self.tiempos['carga']:.1f} s, calentamiento {self.tiempos['calentamiento']:.1f} s)"
+        return clasificador
+
+
+def calentar(clasificador):
+    """Hace predicciones con entradas vacías para que la primera sesión no pague la preparación del modelo."""
+    for tamano in LOTES_CALENTAMIENTO:
+        clasificador.modelo.predict_on_batch(np.zeros((tamano, TAMANO_ENTRADA, TAMANO_ENTRADA, 1), dtype=np.float32))
+
+
+# Gestor compartido por todo el proceso
+gestor = GestorModelos()
+
+
+def configurar_carpeta_pesos(carpeta):
+    """Usa `carpeta` para los pesos en este proceso y en los procesos trabajadores que se creen después."""
+    os.environ[VARIABLE_CARPETA_PESOS] = carpeta
+    gestor.carpeta_pesos = carpeta
+
+
+def configurar_motor(motor, ruta_onnx=None):
+    """Elige el motor de inferencia en este proceso y en los procesos trabajadores que se creen después."""
+    os.environ[VARIABLE_MOTOR] = motor
+    gestor.motor = motor
+    if ruta_onnx:
+        os.environ[VARIABLE_MODELO_ONNX] = ruta_onnx
+        gestor.ruta_onnx = ruta_onnx
+
+
+def obtener_clasificador():
+    """Devuelve el clasificador compartido por el proceso."""
+    return gestor.clasificador()
+
+
+def preparar_carpeta_pesos(carpeta, origen=None):
+    """Copia los pesos ya descargados (de ~/.deepface por defecto) a una carpeta para usarla sin conexión."""
+    origen = ruta_pesos(origen or os.environ.get("DEEPFACE_HOME", os.path.expanduser("~")))
+    destino = ruta_pesos(carpeta)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    shutil.copy2(origen, destino)
+    return destino
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carga y calienta el modelo de emociones e informa de los tiempos.")
+    parser.add_argument("--pesos", help="Carpeta local con los pesos (sin conexión)")
+    parser.add_argument("--motor", choices=MOTORES, help="Motor de inferencia del modelo de emociones")
+    parser.add_argument("--modelo-onnx", help="Modelo ONNX para los motores onnx y dnn")
+    parser.add_argument("--preparar", metavar="CARPETA", help="Copiar los pesos descargados a CARPETA para otros equipos")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.preparar:
+            print(f"Pesos copiados a {preparar_carpeta_pesos(args.preparar)}")
+            return 0
+        if args.pesos:
+            configurar_carpeta_pesos(args.pesos)
+        if args.motor:
+            configurar_motor(args.motor, args.modelo_onnx)
+        gestor.clasificador()
+    except Exception as e:
+        print(f"Error al cargar el modelo de emociones: {e}")
+        return 1
+    print(gestor.estado)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
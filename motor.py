@@ -0,0 +1,235 @@
+import csv
+import json
+import os
+import time
+from collections import Counter
+
+import cv2
+
+from detectores import crear_detector
+from emociones import AcumuladorLotes, ETIQUETAS_EMOCION, emociones_traducidas
+from modelos import obtener_clasificador
+from registro import RegistroRostros
+from tendencias import CAPACIDAD_SERIE, SerieEmociones
+
+# Resolución a la que se analiza cada fotograma (la misma que usan las interfaces)
+TAMANO_ANALISIS = (640, 360)
+
+# Extensiones de video que se procesan al recibir una carpeta
+EXTENSIONES_VIDEO = (".mp4", ".avi", ".mov", ".mkv")
+
+
+def listar_videos(rutas):
+    """Expande archivos y carpetas a una lista ordenada de videos."""
+    videos = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            for archivo in sorted(os.listdir(ruta)):
+                if archivo.lower().endswith(EXTENSIONES_VIDEO):
+                    videos.append(os.path.join(ruta, archivo))
+        else:
+            videos.append(ruta)
+    return videos
+
+
+class ResultadoAnalisis:
+    """Resumen de emociones y registros por rostro de un análisis."""
+
+    def __init__(self, fuente):
+        self.fuente = str(fuente)
+        self.resultados = Counter()
+        self.registros = []
+        self.fotogramas = 0
+        self.duracion = 0.0
+        # Contadores de trabajo realizado (detecciones, clasificaciones...) de las etapas opcionales
+        self.estadisticas = Counter()
+
+    def agregar(self, indice, tiempo, caja, emocion, probabilidades, peso=1, pista=None):
+        """Registra un rostro clasificado y lo suma al contador de emociones.
+
+        `peso` es el número de fotogramas que representa el análisis cuando se muestrea,
+        para que los totales sean comparables con los de un análisis de todos los fotogramas.
+        `pista` es el identificador estable del rostro cuando se usa seguimiento. Se guarda también
+        el "instante" (fecha y hora) en que se analizó, para el registro binario.
+        """
+        emocion_es = emociones_traducidas.get(emocion, emocion)
+        self.resultados[emocion_es] += peso
+        x, y, w, h = (int(v) for v in caja)
+        self.registros.append({
+            "fotograma": indice,
+            "tiempo": round(tiempo, 3),
+            "instante": round(time.time(), 3),
+            "x": x, "y": y, "w": w, "h": h,
+            "emocion": emocion_es,
+            "peso": peso,
+            "pista": pista,
+            "probabilidades": [round(float(p), 4) for p in probabilidades],
+        })
+
+    def extender(self, otro):
+        """Añade a continuación los resultados de otro análisis de la misma fuente."""
+        self.resultados.update(otro.resultados)
+        self.registros.extend(otro.registros)
+        self.fotogramas += otro.fotogramas
+        self.estadisticas.update(otro.estadisticas)
+
+    def resumen(self):
+        resumen = {
+            "fuente": self.fuente,
+            "fotogramas": self.fotogramas,
+            "duracion_s": round(self.duracion, 3),
+            "resultados": dict(self.resultados),
+        }
+        if self.estadisticas:
+            resumen["estadisticas"] = dict(self.estadisticas)
+        return resumen
+
+    def tendencias(self):
+        """Distribuciones de emociones de los últimos minutos de la fuente y medias móviles (ver tendencias.SerieEmociones)."""
+        serie = SerieEmociones(min(CAPACIDAD_SERIE, max(1, len(self.registros))))
+        # El tiempo de la fuente hace de reloj: las ventanas terminan en el último rostro analizado
+        serie.agregar_historial([r["tiempo"] for r in self.registros], [r["probabilidades"] for r in self.registros])
+        return serie.instantanea(ahora=self.registros[-1]["tiempo"] if self.registros else 0.0)
+
+    def guardar_json(self, ruta):
+        datos = self.resumen()
+        datos["etiquetas"] = ETIQUETAS_EMOCION
+        datos["tendencias"] = self.tendencias()
+        datos["registros"] = self.registros
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            json.dump(datos, archivo, ensure_ascii=False, indent=2)
+
+    def guardar_registro(self, ruta):
+        """Escribe los registros en el formato binario compacto de registro.py."""
+        with RegistroRostros(ruta, self.fuente) as registro:
+            for r in self.registros:
+                registro.agregar(r["fotograma"], r["tiempo"], (r["x"], r["y"], r["w"], r["h"]), r["probabilidades"], r["pista"],
+                                 instante=r["instante"], peso=r["peso"])
+
+    def guardar_csv(self, ruta):
+        with open(ruta, "w", newline="", encoding="utf-8") as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(["fotograma", "tiempo", "x", "y", "w", "h", "emocion", "peso", "pista"] + ETIQUETAS_EMOCION)
+            for r in self.registros:
+                escritor.writerow([r["fotograma"], r["tiempo"], r["x"], r["y"], r["w"], r["h"], r["emocion"], r["peso"], r["pista"]] + r["probabilidades"])
+
+
+class MotorEmociones:
+    """Detección y clasificación de emociones sin ninguna dependencia de la interfaz gráfica."""
+
+    def __init__(self, clasificador=None, detector=None, tamano=TAMANO_ANALISIS):
+        self.clasificador = clasificador if clasificador is not None else obtener_clasificador()
+        # `detector` es un objeto de detectores.py o su nombre; por defecto, el configurado
+        self.detector = detector if detector is not None and not isinstance(detector, str) else crear_detector(detector)
+        self.tamano = tamano
+
+    def preparar(self, frame):
+        """Redimensiona el fotograma y devuelve (fotograma, escala de grises)."""
+        if self.tamano:
+            frame = cv2.resize(frame, self.tamano)
+        return frame, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def detectar(self, gray_frame, frame=None, filtro=None):
+        """Devuelve las cajas (x, y, w, h) de los rostros; los detectores que usan color reciben `frame`.
+
+        Con `filtro` (ver calidad.FiltroCalidad) sólo se devuelven los rostros que lo superan.
+        """
+        imagen = frame if frame is not None and self.detector.usa_color else gray_frame
+        if filtro is None:
+            return self.detector.detectar(imagen)
+        confianzas = None
+        if filtro.confianza_minima is not None and hasattr(self.detector, "detectar_con_confianza"):
+            cajas, confianzas = self.detector.detectar_con_confianza(imagen)
+        else:
+            cajas = self.detector.detectar(imagen)
+        return filtro.filtrar(gray_frame, cajas, confianzas)
+
+    def procesar_fotograma(self, frame):
+        """Analiza un fotograma BGR y devuelve (fotograma redimensionado, [(caja, emoción, probabilidades)])."""
+        frame, gray_frame = self.preparar(frame)
+        faces = self.detectar(gray_frame, frame)
+        clasificaciones = self.clasificador.clasificar_lote([gray_frame[y:y + h, x:x + w] for (x, y, w, h) in faces])
+        detecciones = [(caja, c[0], c[1]) for caja, c in zip(faces, clasificaciones) if c is not None]
+        return frame, detecciones
+
+    def analizar(self, fuente, frames_por_lote=1, detener=None, inicio=0, fin=None, muestreador=None, seguidor=None, filtro=None):
+        """Recorre una fuente de video sin mostrar nada y devuelve un ResultadoAnalisis.
+
+        `frames_por_lote` agrupa los rostros de varios fotogramas en una sola predicción;
+        `detener` es una función opcional que devuelve True para interrumpir el análisis.
+        `inicio` y `fin` limitan el análisis a un rango de fotogramas [inicio, fin).
+        `muestreador` (ver muestreo.Muestreador) decide cuántos fotogramas saltar entre análisis.
+        `seguidor` (ver seguimiento.SeguidorRostros) sustituye la detección y clasificación en cada
+        fotograma por pistas que sólo se detectan y clasifican cada cierto tiempo; con él los rostros
+        se clasifican fotograma a fotograma y `frames_por_lote` no se aplica.
+        `filtro` (ver calidad.FiltroCalidad) descarta los rostros de mala calidad antes de clasificarlos.
+        """
+        resultado = ResultadoAnalisis(fuente)
+        acumulador = AcumuladorLotes(self.clasificador, frames_por_lote)
+        cap = cv2.VideoCapture(fuente)
+        if not cap.isOpened():
+            raise IOError(f"No se pudo abrir la fuente de video: {fuente}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0
+        if inicio:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, inicio)
+        if muestreador is not None:
+            muestreador.reiniciar(fps)
+        if seguidor is not None:
+            seguidor.reiniciar()
+        if filtro is not None:
+            filtro.reiniciar()
+        reloj = time.monotonic()
+
+        def registrar(lotes):
+            for (indice, tiempo, faces, peso), clasificaciones in lotes:
+                for caja, clasificacion in zip(faces, clasificaciones):
+                    if clasificacion is not None:
+                        resultado.agregar(indice, tiempo, caja, clasificacion[0], clasificacion[1], peso)
+
+        indice = inicio
+        while cap.isOpened() and (fin is None or indice < fin):
+            if detener is not None and detener():
+                break
+
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            tiempo = indice / fps if fps > 0 else time.monotonic() - reloj
+            frame, gray_frame = self.preparar(frame)
+            if seguidor is not None:
+                por_clasificar = seguidor.actualizar(gray_frame, indice, lambda gris: self.detectar(gris, frame, filtro))
+                faces = [pista.caja for pista in seguidor.pistas]
+            else:
+                faces = self.detectar(gray_frame, frame, filtro)
+            salto = muestreador.siguiente(gray_frame, len(faces) > 0) if muestreador is not None else 0
+            # Los fotogramas que no se analizan se avanzan con grab(), sin decodificarlos. Cada análisis
+            # representa a los que de verdad se han avanzado tras él (el número total de fotogramas del
+            # contenedor es sólo una estimación), así que se saltan antes de registrar sus rostros
+            avanzados = 0
+            while avanzados < salto and (fin is None or indice + 1 + avanzados < fin) and cap.grab():
+                avanzados += 1
+            peso = avanzados + 1
+
+            if seguidor is not None:
+                rois = [gray_frame[y:y + h, x:x + w] for (x, y, w, h) in (pista.caja for pista in por_clasificar)]
+                seguidor.asignar(por_clasificar, self.clasificador.clasificar_lote(rois), gray_frame, indice)
+                for pista in seguidor.pistas:
+                    if pista.emocion is not None:
+                        resultado.agregar(indice, tiempo, pista.caja, pista.emocion, pista.probabilidades, peso, pista.id)
+            else:
+                rois = [gray_frame[y:y + h, x:x + w] for (x, y, w, h) in faces]
+                registrar(acumulador.agregar((indice, tiempo, faces, peso), rois))
+            indice += peso
+
+        registrar(acumulador.vaciar())
+        cap.release()
+
+        if seguidor is not None:
+            resultado.estadisticas.update(seguidor.estadisticas())
+        if filtro is not None:
+            resultado.estadisticas.update(filtro.estadisticas())
+
+        resultado.fotogramas = indice - inicio
+        resultado.duracion = time.monotonic() - reloj
+        return resultado
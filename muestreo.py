@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+# Tamaño de la miniatura con la que se detectan cambios de escena
+TAMANO_MINIATURA = (32, 18)
+
+# FPS supuestos cuando la fuente no informa de los suyos (cámaras web)
+FPS_POR_DEFECTO = 30.0
+
+
+class Muestreador:
+    """Decide cuántos fotogramas se saltan (con grab(), sin decodificar) entre dos análisis.
+
+    - `paso`: analiza uno de cada `paso` fotogramas.
+    - `frecuencia`: analiza `frecuencia` fotogramas por segundo de video.
+    - `adaptativo`: parte de `frecuencia` (o `frecuencia_min`) y sube hasta `frecuencia_max`
+      cuando hay rostros o la escena cambia; sin actividad reduce la frecuencia a la mitad
+      en cada análisis hasta `frecuencia_min`.
+    """
+
+    def __init__(self, paso=1, frecuencia=None, adaptativo=False, frecuencia_min=1.0, frecuencia_max=None, umbral_cambio=12.0):
+        self.paso = max(1, paso)
+        self.frecuencia = frecuencia
+        self.adaptativo = adaptativo
+        self.frecuencia_min = frecuencia_min
+        self.frecuencia_max = frecuencia_max
+        self.umbral_cambio = umbral_cambio
+        self.reiniciar()
+
+    def reiniciar(self, fps=0):
+        """Prepara el muestreador para una nueva fuente con los FPS indicados."""
+        self.fps = fps if fps > 0 else FPS_POR_DEFECTO
+        self.frecuencia_actual = self.frecuencia or self.frecuencia_min
+        self._miniatura = None
+
+    def cambio_escena(self, gray_frame):
+        """Compara una miniatura del fotograma con la del análisis anterior."""
+        miniatura = cv2.resize(gray_frame, TAMANO_MINIATURA, interpolation=cv2.INTER_AREA).astype(np.int16)
+        anterior, self._miniatura = self._miniatura, miniatura
+        return anterior is None or float(np.abs(miniatura - anterior).mean()) > self.umbral_cambio
+
+    def _salto_para(self, frecuencia):
+        return max(0, int(round(self.fps / frecuencia)) - 1)
+
+    def siguiente(self, gray_frame, hay_rostros):
+        """Devuelve cuántos fotogramas saltar tras analizar `gray_frame`."""
+        if self.adaptativo:
+            maxima = self.frecuencia_max or self.fps
+            if hay_rostros or self.cambio_escena(gray_frame):
+                self.frecuencia_actual = maxima
+            else:
+                self.frecuencia_actual = max(self.frecuencia_min, self.frecuencia_actual / 2)
+            return self._salto_para(self.frecuencia_actual)
+        if self.frecuencia:
+            return self._salto_para(self.frecuencia)
+        return self.paso - 1
+
+
+def agregar_opciones_muestreo(parser):
+    """Añade a un ArgumentParser las opciones de muestreo de fotogramas."""
+    grupo = parser.add_argument_group("muestreo")
+    grupo.add_argument("--paso", type=int, default=1, help="Analizar uno de cada N fotogramas")
+    grupo.add_argument("--frecuencia", type=float, help="Análisis por segundo de video")
+    grupo.add_argument("--adaptativo", action="store_true", help="Subir la frecuencia con rostros o cambios de escena y bajarla sin actividad")
+    grupo.add_argument("--frecuencia-min", type=float, default=1.0, help="Frecuencia mínima del modo adaptativo")
+    grupo.add_argument("--frecuencia-max", type=float, help="Frecuencia máxima del modo adaptativo (por defecto, los FPS del video)")
+
+
+def muestreador_desde_argumentos(args):
+    """Crea el Muestreador pedido en la línea de comandos, o None si se analizan todos los fotogramas."""
+    if args.paso <= 1 and not args.frecuencia and not args.adaptativo:
+        return None
+    return Muestreador(args.paso, args.frecuencia, args.adaptativo, args.frecuencia_min, args.frecuencia_max)
@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import time
+
+import cv2
+
+from motor import MotorEmociones, ResultadoAnalisis
+
+# Motor propio de cada proceso trabajador, cargado una sola vez en el inicializador
+_motor = None
+
+
+def dividir_rangos(total, partes):
+    """Divide [0, total) en como mucho `partes` rangos contiguos de tamaño parecido."""
+    partes = max(1, min(partes, total))
+    tamano, resto = divmod(total, partes)
+    rangos = []
+    inicio = 0
+    for i in range(partes):
+        fin = inicio + tamano + (1 if i < resto else 0)
+        rangos.append((inicio, fin))
+        inicio = fin
+    return rangos
+
+
+def inicializar_trabajador():
+    """Carga el clasificador Haar y el modelo de emociones una vez por proceso."""
+    global _motor
+    # Con un proceso por núcleo, los hilos internos de OpenCV sólo compiten entre sí
+    cv2.setNumThreads(1)
+    _motor = MotorEmociones()
+
+
+def motor_del_proceso():
+    """Devuelve el motor cargado por inicializar_trabajador en este proceso."""
+    return _motor
+
+
+def _analizar_rango(argumentos):
+    fuente, inicio, fin, opciones = argumentos
+    return _motor.analizar(fuente, inicio=inicio, fin=fin, **opciones)
+
+
+def analizar_en_procesos(fuente, procesos=None, rangos_por_proceso=4, **opciones):
+    """Analiza un video largo repartiendo rangos de fotogramas entre varios procesos.
+
+    Los resultados de cada rango se combinan en el orden de los fotogramas, así que sin
+    muestreo, o con un paso o una frecuencia fijos, el ResultadoAnalisis final es el de un
+    recorrido secuencial. El muestreo adaptativo empieza de nuevo en cada rango, por lo que
+    puede elegir fotogramas algo distintos. `opciones` se pasan tal cual a MotorEmociones.analizar
+    (frames_por_lote, muestreador, filtro...); no admite `seguidor`, porque cada rango
+    numeraría sus pistas desde 1 y una misma persona tendría un identificador en cada rango.
+    """
+    if opciones.get("seguidor") is not None:
+        raise ValueError("El seguimiento de rostros no se puede repartir por rangos de fotogramas")
+    procesos = procesos or os.cpu_count() or 1
+    cap = cv2.VideoCapture(fuente)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    cap.release()
+
+    if total <= 0 or procesos == 1:
+        # Sin número de fotogramas conocido no se puede dividir el video
+        return MotorEmociones().analizar(fuente, **opciones)
+
+    # Más rangos que procesos para repartir mejor la carga entre zonas con y sin rostros
+    rangos = dividir_rangos(total, procesos * rangos_por_proceso)
+    # El número de fotogramas es sólo una estimación en muchos contenedores: el último rango se lee hasta el final
+    rangos[-1] = (rangos[-1][0], None)
+    resultado = ResultadoAnalisis(fuente)
+    inicio = time.monotonic()
+
+    # "spawn" evita heredar el estado de TensorFlow del proceso principal
+    contexto = multiprocessing.get_context("spawn")
+    with contexto.Pool(procesos, initializer=inicializar_trabajador) as pool:
+        for parcial in pool.imap(_analizar_rango, [(fuente, a, b, opciones) for a, b in rangos]):
+            resultado.extender(parcial)
+
+    resultado.duracion = time.monotonic() - inicio
+    return resultado
@@ -0,0 +1,192 @@
+import heapq
+import queue
+import threading
+import time
+
+import cv2
+
+from motor import MotorEmociones, ResultadoAnalisis
+
+# Políticas cuando una cola está llena
+BLOQUEAR = "bloquear"    # archivos: la captura espera y no se pierde ningún fotograma
+DESCARTAR = "descartar"  # fuentes en vivo: se descarta el fotograma más antiguo para no acumular latencia
+
+_FIN = object()
+
+
+class PipelineEmociones:
+    """Análisis por etapas (captura, detección, clasificación y consumo) unidas por colas acotadas.
+
+    La captura corre en su propio hilo, la detección en `trabajadores_deteccion` hilos con su propio
+    clasificador Haar y la clasificación en un único hilo que agrupa en una sola predicción los
+    rostros de todos los fotogramas disponibles. Al iterar se obtienen, en orden, tuplas
+    (índice, tiempo, fotograma, [(caja, emoción, probabilidades)]). Con `filtro`
+    (ver calidad.FiltroCalidad) los rostros de mala calidad se descartan en la detección.
+    """
+
+    def __init__(self, motor, fuente, trabajadores_deteccion=2, politica=None, tamano_cola=4, max_lote=16, filtro=None):
+        self.motor = motor
+        self.filtro = filtro
+        self.fuente = fuente
+        self.trabajadores_deteccion = max(1, trabajadores_deteccion)
+        # Las cámaras se identifican por un índice entero y por defecto descartan fotogramas viejos
+        self.politica = politica or (DESCARTAR if isinstance(fuente, int) else BLOQUEAR)
+        self.max_lote = max(1, max_lote)
+        self.cola_fotogramas = queue.Queue(tamano_cola)
+        self.cola_rostros = queue.Queue(tamano_cola * self.trabajadores_deteccion)
+        self.cola_salida = queue.Queue(tamano_cola)
+        self.fps = 0
+        self.descartados = 0
+        self._secuencia = 0
+        self._candado = threading.Lock()
+        self._detenido = threading.Event()
+        self._hilos = []
+
+    def iniciar(self):
+        self._hilos = [threading.Thread(target=self._capturar, daemon=True)]
+        self._hilos += [threading.Thread(target=self._detectar, daemon=True) for _ in range(self.trabajadores_deteccion)]
+        self._hilos.append(threading.Thread(target=self._clasificar, daemon=True))
+        for hilo in self._hilos:
+            hilo.start()
+
+    def detener(self):
+        self._detenido.set()
+
+    def __iter__(self):
+        if not self._hilos:
+            self.iniciar()
+        try:
+            while True:
+                item = self._tomar(self.cola_salida)
+                if item is _FIN:
+                    break
+                yield item
+        finally:
+            self.detener()
+
+    def _poner(self, cola, item, descartar=False):
+        """Encola sin bloquearse para siempre; con `descartar` hace sitio tirando el elemento más antiguo."""
+        while not self._detenido.is_set():
+            try:
+                if descartar:
+                    cola.put_nowait(item)
+                else:
+                    cola.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if descartar:
+                    try:
+                        cola.get_nowait()
+                        self.descartados += 1
+                    except queue.Empty:
+                        pass
+        return False
+
+    def _tomar(self, cola):
+        while not self._detenido.is_set():
+            try:
+                return cola.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _FIN
+
+    def _capturar(self):
+        cap = cv2.VideoCapture(self.fuente)
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 0
+        inicio = time.monotonic()
+        indice = 0
+        try:
+            while cap.isOpened() and not self._detenido.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                tiempo = indice / self.fps if self.fps > 0 else time.monotonic() - inicio
+                self._poner(self.cola_fotogramas, (indice, tiempo, frame), self.politica == DESCARTAR)
+                indice += 1
+        finally:
+            cap.release()
+            for _ in range(self.trabajadores_deteccion):
+                self._poner(self.cola_fotogramas, _FIN)
+
+    def _detectar(self):
+        # Cada hilo tiene su propio detector; el modelo de emociones es compartido
+        motor = MotorEmociones(clasificador=self.motor.clasificador, detector=self.motor.detector.clonar(), tamano=self.motor.tamano)
+        while True:
+            # Numerar al sacar de la cola mantiene la secuencia consecutiva aunque se descarten fotogramas
+            with self._candado:
+                item = self._tomar(self.cola_fotogramas)
+                if item is _FIN:
+                    break
+                secuencia = self._secuencia
+                self._secuencia += 1
+
+            indice, tiempo, frame = item
+            try:
+                frame, gray_frame = motor.preparar(frame)
+                faces = motor.detectar(gray_frame, frame, self.filtro)
+                rois = [gray_frame[y:y + h, x:x + w] for (x, y, w, h) in faces]
+            except Exception as e:
+                print(f"Error en detección: {e}")
+                faces, rois = [], []
+            self._poner(self.cola_rostros, (secuencia, indice, tiempo, frame, faces, rois))
+        self._poner(self.cola_rostros, _FIN)
+
+    def _clasificar(self):
+        pendientes = []
+        siguiente = 0
+        activos = self.trabajadores_deteccion
+        while activos and not self._detenido.is_set():
+            # Tomar todo lo que esté disponible para clasificarlo en una sola predicción
+            lote = [self._tomar(self.cola_rostros)]
+            while len(lote) < self.max_lote:
+                try:
+                    lote.append(self.cola_rostros.get_nowait())
+                except queue.Empty:
+                    break
+
+            for item in lote:
+                if item is _FIN:
+                    activos -= 1
+                else:
+                    heapq.heappush(pendientes, item)
+
+            # Los detectores pueden terminar desordenados; sólo se emite lo que ya es consecutivo
+            listos = []
+            while pendientes and pendientes[0][0] == siguiente:
+                listos.append(heapq.heappop(pendientes))
+                siguiente += 1
+            self._emitir(listos)
+
+        self._emitir([heapq.heappop(pendientes) for _ in range(len(pendientes))])
+        self._poner(self.cola_salida, _FIN)
+
+    def _emitir(self, listos):
+        if not listos:
+            return
+        try:
+            clasificaciones = self.motor.clasificador.clasificar_lote([roi for item in listos for roi in item[5]])
+        except Exception as e:
+            print(f"Error en análisis: {e}")
+            clasificaciones = [None] * sum(len(item[5]) for item in listos)
+
+        inicio = 0
+        for _, indice, tiempo, frame, faces, rois in listos:
+            detecciones = [(caja, c[0], c[1]) for caja, c in zip(faces, clasificaciones[inicio:inicio + len(rois)]) if c is not None]
+            inicio += len(rois)
+            self._poner(self.cola_salida, (indice, tiempo, frame, detecciones), self.politica == DESCARTAR)
+
+
+def analizar_con_pipeline(motor, fuente, trabajadores_deteccion=2, filtro=None):
+    """Versión por etapas de MotorEmociones.analizar para aprovechar varios núcleos con archivos."""
+    resultado = ResultadoAnalisis(fuente)
+    inicio = time.monotonic()
+    if filtro is not None:
+        filtro.reiniciar()
+    for indice, tiempo, _, detecciones in PipelineEmociones(motor, fuente, trabajadores_deteccion, filtro=filtro):
+        for caja, emocion, probabilidades in detecciones:
+            resultado.agregar(indice, tiempo, caja, emocion, probabilidades)
+        resultado.fotogramas = indice + 1
+    if filtro is not None:
+        resultado.estadisticas.update(filtro.estadisticas())
+    resultado.duracion = time.monotonic() - inicio
+    return resultado
@@ -0,0 +1,201 @@
+import argparse
+import csv
+import json
+import os
+import struct
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from emociones import ETIQUETAS_EMOCION, emociones_traducidas
+
+# Identificación y versión del formato, al principio de cada archivo
+MAGICO = b"EMOREG1\n"
+EXTENSION_REGISTRO = ".emo"
+EXTENSION_CLIENTES = ".clientes"
+
+# Un registro por rostro analizado, de ancho fijo (46 bytes) y en little-endian
+REGISTRO = np.dtype([
+    ("instante", "<f8"),    # segundos desde 1970 en que se analizó el rostro
+    ("tiempo", "<f4"),      # segundos desde el inicio de la fuente
+    ("fotograma", "<u4"),
+    ("x", "<i2"), ("y", "<i2"), ("w", "<i2"), ("h", "<i2"),
+    ("pista", "<i4"),       # -1 sin seguimiento
+    ("cliente", "<u2"),     # 0 sin identificar; n es la línea n del archivo .clientes
+    ("peso", "<u2"),        # fotogramas que representa el análisis cuando se muestrea
+    ("probabilidades", "<f2", (len(ETIQUETAS_EMOCION),)),
+])
+
+# Registros que se acumulan en memoria antes de escribirlos de una vez
+CAPACIDAD_BUFFER = 4096
+
+
+def ruta_registro(carpeta, fuente):
+    """Ruta de un registro nuevo en `carpeta` con la fecha y el nombre de la fuente."""
+    nombre = os.path.splitext(os.path.basename(str(fuente)))[0] or "sesion"
+    return os.path.join(carpeta, f"{time.strftime('%Y%m%d_%H%M%S')}_{nombre}{EXTENSION_REGISTRO}")
+
+
+class RegistroRostros:
+    """Escribe cada rostro analizado en un archivo binario de solo añadir.
+
+    Los registros (ver REGISTRO) se acumulan en un buffer de `capacidad` filas que se escribe de
+    una vez al llenarse, cada `intervalo_volcado` segundos y al cerrar, de modo que la memoria no
+    crece con la duración de la sesión. Los nombres de los clientes se guardan aparte, uno por línea
+    y en el orden en que aparecen, en el archivo .clientes con el mismo nombre.
+    """
+
+    def __init__(self, ruta, fuente=None, capacidad=CAPACIDAD_BUFFER, intervalo_volcado=5.0):
+        self.ruta = ruta
+        self.intervalo_volcado = intervalo_volcado
+        self.escritos = 0
+        self._buffer = np.zeros(capacidad, REGISTRO)
+        self._pendientes = 0
+        self._clientes = {}
+        self._candado = threading.Lock()
+        self._ultimo_volcado = time.monotonic()
+
+        carpeta = os.path.dirname(ruta)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        cabecera = json.dumps({
+            "version": 2,
+            "campos": [list(campo) for campo in REGISTRO.descr],
+            "etiquetas": ETIQUETAS_EMOCION,
+            "fuente": None if fuente is None else str(fuente),
+            "inicio": time.time(),
+        }, ensure_ascii=False).encode("utf-8")
+        self._archivo = open(ruta, "wb")
+        self._archivo.write(MAGICO + struct.pack("<I", len(cabecera)) + cabecera)
+        self._archivo_clientes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
+
+    def _indice_cliente(self, cliente):
+        if cliente is None:
+            return 0
+        if cliente not in self._clientes:
+            if self._archivo_clientes is None:
+                self._archivo_clientes = open(self.ruta + EXTENSION_CLIENTES, "w", encoding="utf-8")
+            self._archivo_clientes.write(cliente + "\n")
+            self._archivo_clientes.flush()
+            self._clientes[cliente] = len(self._clientes) + 1
+        return self._clientes[cliente]
+
+    def agregar(self, fotograma, tiempo, caja, probabilidades, pista=None, cliente=None, instante=None, peso=1):
+        """Añade un rostro; `cliente` es el nombre identificado o None e `instante`, por defecto, el momento actual."""
+        with self._candado:
+            if self._archivo is None:
+                return
+            fila = self._buffer[self._pendientes]
+            fila["instante"] = time.time() if instante is None else instante
+            fila["tiempo"] = tiempo
+            fila["fotograma"] = fotograma
+            fila["x"], fila["y"], fila["w"], fila["h"] = (int(v) for v in caja)
+            fila["pista"] = -1 if pista is None else pista
+            fila["cliente"] = self._indice_cliente(cliente)
+            fila["peso"] = min(peso, np.iinfo(np.uint16).max)
+            fila["probabilidades"] = probabilidades
+            self._pendientes += 1
+            if self._pendientes == len(self._buffer) or time.monotonic() - self._ultimo_volcado >= self.intervalo_volcado:
+                self._volcar()
+
+    def _volcar(self):
+        if self._pendientes:
+            self._archivo.write(self._buffer[:self._pendientes].tobytes())
+            self._archivo.flush()
+            self.escritos += self._pendientes
+            self._pendientes = 0
+        self._ultimo_volcado = time.monotonic()
+
+    def volcar(self):
+        """Escribe en el archivo los registros que aún están en memoria."""
+        with self._candado:
+            if self._archivo is not None:
+                self._volcar()
+
+    def cerrar(self):
+        with self._candado:
+            if self._archivo is None:
+                return
+            self._volcar()
+            self._archivo.close()
+            self._archivo = None
+            if self._archivo_clientes is not None:
+                self._archivo_clientes.close()
+
+
+def leer_registro(ruta):
+    """Devuelve (cabecera, registros, clientes) de un archivo de registro.
+
+    Los registros se proyectan en memoria (np.memmap) sin cargarlos; un registro incompleto al final
+    (por ejemplo, si la sesión terminó de golpe) se ignora. `clientes[0]` es None. Los campos se
+    toman de la cabecera, así que también se leen los archivos de la versión 1, sin "peso".
+    """
+    with open(ruta, "rb") as archivo:
+        if archivo.read(len(MAGICO)) != MAGICO:
+            raise ValueError(f"{ruta} no es un registro de rostros")
+        longitud, = struct.unpack("<I", archivo.read(4))
+        cabecera = json.loads(archivo.read(longitud).decode("utf-8"))
+    tipo = np.dtype([tuple(campo[:2]) + tuple(tuple(forma) for forma in campo[2:]) for campo in cabecera["campos"]])
+    inicio = len(MAGICO) + 4 + longitud
+    cantidad = (os.path.getsize(ruta) - inicio) // tipo.itemsize
+    registros = np.memmap(ruta, tipo, mode="r", offset=inicio, shape=(cantidad,)) if cantidad else np.zeros(0, tipo)
+
+    clientes = [None]
+    if os.path.exists(ruta + EXTENSION_CLIENTES):
+        with open(ruta + EXTENSION_CLIENTES, encoding="utf-8") as archivo:
+            clientes += archivo.read().splitlines()
+    return cabecera, registros, clientes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resume o exporta un registro de rostros (.emo).")
+    parser.add_argument("registro", help="Archivo de registro")
+    parser.add_argument("--csv", help="Exportar los registros a este archivo CSV")
+    args = parser.parse_args(argv)
+
+    try:
+        cabecera, registros, clientes = leer_registro(args.registro)
+    except (OSError, ValueError) as e:
+        print(f"Error al leer el registro: {e}")
+        return 1
+    etiquetas = cabecera["etiquetas"]
+    con_peso = "peso" in registros.dtype.names
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(["instante", "tiempo", "fotograma", "x", "y", "w", "h", "pista", "cliente", "peso"] + etiquetas)
+            # Por bloques, para no cargar en memoria registros de sesiones largas
+            for inicio in range(0, len(registros), CAPACIDAD_BUFFER):
+                for r in registros[inicio:inicio + CAPACIDAD_BUFFER]:
+                    escritor.writerow([f"{r['instante']:.3f}", f"{r['tiempo']:.3f}", r["fotograma"], r["x"], r["y"], r["w"], r["h"],
+                                       r["pista"], clientes[r["cliente"]] or "", r["peso"] if con_peso else 1] + [f"{p:.4f}" for p in r["probabilidades"]])
+        print(f"Registros exportados a {args.csv}")
+
+    print(f"{len(registros)} rostros de {cabecera.get('fuente')}")
+    if not len(registros):
+        return 0
+    print(f"Duración: {float(registros['instante'][-1] - registros['instante'][0]):.1f} s")
+    for indice_cliente, nombre in enumerate(clientes):
+        seleccion = registros["cliente"] == indice_cliente
+        dominantes = registros["probabilidades"][seleccion].argmax(axis=1)
+        if not len(dominantes):
+            continue
+        # Con muestreo cada rostro cuenta por los fotogramas que representa, como en el resumen JSON
+        pesos = registros["peso"][seleccion] if con_peso else None
+        conteo = Counter(dict(zip((emociones_traducidas.get(e, e) for e in etiquetas), np.bincount(dominantes, pesos, len(etiquetas)).tolist())))
+        total = sum(conteo.values())
+        print(f"{nombre or 'Sin identificar'}: " + ", ".join(f"{emocion} {n / total:.1%}" for emocion, n in conteo.most_common() if n))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,195 @@
+import itertools
+
+import cv2
+import numpy as np
+
+# Tamaño de la huella con la que se decide si un rostro ha cambiado desde su última clasificación
+TAMANO_HUELLA = (24, 24)
+
+
+def iou(a, b):
+    """Intersección sobre unión de dos cajas (x, y, w, h)."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ancho = min(ax + aw, bx + bw) - max(ax, bx)
+    alto = min(ay + ah, by + bh) - max(ay, by)
+    interseccion = max(0, ancho) * max(0, alto)
+    union = aw * ah + bw * bh - interseccion
+    return interseccion / union if union > 0 else 0.0
+
+
+def _huella(gray_frame, caja):
+    x, y, w, h = caja
+    return cv2.resize(gray_frame[y:y + h, x:x + w], TAMANO_HUELLA, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+class Pista:
+    """Un rostro seguido entre fotogramas con su última emoción conocida."""
+
+    def __init__(self, id_pista, caja, gray_frame):
+        self.id = id_pista
+        self.emocion = None
+        self.probabilidades = None
+        self.clasificada_en = None
+        self.huella = None
+        self.mover(caja, gray_frame)
+
+    def mover(self, caja, gray_frame):
+        x, y, w, h = (int(v) for v in caja)
+        self.caja = (x, y, w, h)
+        self.plantilla = gray_frame[y:y + h, x:x + w].copy()
+
+
+class SeguidorRostros:
+    """Mantiene identificadores estables de rostros y evita detectar y clasificar en cada fotograma.
+
+    El detector completo sólo se ejecuta cada `intervalo_deteccion` fotogramas o cuando se pierde
+    una pista; entre medias las cajas se propagan por correlación de plantillas en una ventana
+    alrededor de la posición anterior. Cada pista se vuelve a clasificar cada
+    `intervalo_clasificacion` fotogramas o cuando su huella cambia más de `umbral_cambio`.
+    """
+
+    def __init__(self, intervalo_deteccion=10, intervalo_clasificacion=15, umbral_cambio=18.0, umbral_iou=0.3, umbral_similitud=0.6, margen=0.5):
+        self.intervalo_deteccion = max(1, intervalo_deteccion)
+        self.intervalo_clasificacion = max(1, intervalo_clasificacion)
+        self.umbral_cambio = umbral_cambio
+        self.umbral_iou = umbral_iou
+        self.umbral_similitud = umbral_similitud
+        self.margen = margen
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Olvida todas las pistas y contadores, para empezar una fuente nueva."""
+        self.pistas = []
+        self._ids = itertools.count(1)
+        self._ultima_deteccion = None
+        self._forzar_deteccion = True
+        self.fotogramas = 0
+        self.detecciones = 0
+        self.clasificaciones = 0
+
+    def actualizar(self, gray_frame, indice, detectar):
+        """Actualiza las pistas con un fotograma y devuelve las que hay que (re)clasificar.
+
+        `detectar` es una función que recibe el fotograma en gris y devuelve cajas (x, y, w, h).
+        """
+        self.fotogramas += 1
+        if self._forzar_deteccion or self._ultima_deteccion is None or indice - self._ultima_deteccion >= self.intervalo_deteccion:
+            self._asociar(gray_frame, detectar(gray_frame))
+            self.detecciones += 1
+            self._ultima_deteccion = indice
+            self._forzar_deteccion = False
+        else:
+            self._propagar(gray_frame)
+        return [pista for pista in self.pistas if self._necesita_clasificar(pista, gray_frame, indice)]
+
+    def asignar(self, pistas, clasificaciones, gray_frame, indice):
+        """Guarda en cada pista el resultado de clasificar su rostro en este fotograma."""
+        for pista, clasificacion in zip(pistas, clasificaciones):
+            if clasificacion is None:
+                continue
+            pista.emocion, pista.probabilidades = clasificacion
+            pista.clasificada_en = indice
+            pista.huella = _huella(gray_frame, pista.caja)
+            self.clasificaciones += 1
+
+    def estadisticas(self):
+        return {
+            "fotogramas_seguidos": self.fotogramas,
+            "detecciones": self.detecciones,
+            "clasificaciones": self.clasificaciones,
+            "pistas": next(self._ids) - 1,
+        }
+
+    def _asociar(self, gray_frame, cajas):
+        """Empareja las detecciones con las pistas existentes por IoU, de mayor a menor."""
+        pares = sorted(((iou(pista.caja, caja), i, j) for i, pista in enumerate(self.pistas) for j, caja in enumerate(cajas)), reverse=True)
+        pistas_usadas = set()
+        cajas_usadas = set()
+        for valor, i, j in pares:
+            if valor < self.umbral_iou:
+                break
+            if i in pistas_usadas or j in cajas_usadas:
+                continue
+            self.pistas[i].mover(cajas[j], gray_frame)
+            pistas_usadas.add(i)
+            cajas_usadas.add(j)
+
+        nuevas = [Pista(next(self._ids), caja, gray_frame) for j, caja in enumerate(cajas) if j not in cajas_usadas]
+        self.pistas = [pista for i, pista in enumerate(self.pistas) if i in pistas_usadas] + nuevas
+
+    def _propagar(self, gray_frame):
+        """Mueve cada pista a la posición más parecida a su plantilla dentro de una ventana de búsqueda."""
+        alto_imagen, ancho_imagen = gray_frame.shape[:2]
+        vivas = []
+        for pista in self.pistas:
+            x, y, w, h = pista.caja
+            mx, my = int(w * self.margen), int(h * self.margen)
+            x0, y0 = max(0, x - mx), max(0, y - my)
+            region = gray_frame[y0:min(alto_imagen, y + h + my), x0:min(ancho_imagen, x + w + mx)]
+            if region.shape[0] < h or region.shape[1] < w:
+                self._forzar_deteccion = True
+                continue
+
+            _, maximo, _, (dx, dy) = cv2.minMaxLoc(cv2.matchTemplate(region, pista.plantilla, cv2.TM_CCOEFF_NORMED))
+            # Una plantilla uniforme da NaN; se trata como pista perdida
+            if not maximo >= self.umbral_similitud:
+                self._forzar_deteccion = True
+                continue
+            pista.mover((x0 + dx, y0 + dy, w, h), gray_frame)
+            vivas.append(pista)
+        self.pistas = vivas
+
+    def _necesita_clasificar(self, pista, gray_frame, indice):
+        if pista.clasificada_en is None or indice - pista.clasificada_en >= self.intervalo_clasificacion:
+            return True
+        return float(np.abs(_huella(gray_frame, pista.caja) - pista.huella).mean()) > self.umbral_cambio
+
+
+class CacheIdentidades:
+    """Recuerda la identidad resuelta de cada pista y decide cuándo hay que volver a verificarla."""
+
+    def __init__(self, intervalo_verificacion=60):
+        self.intervalo_verificacion = max(1, intervalo_verificacion)
+        self.reiniciar()
+
+    def reiniciar(self):
+        self._identidades = {}
+        self.verificaciones = 0
+
+    def pendientes(self, pistas, indice):
+        """Devuelve las pistas sin identidad o cuya última verificación es demasiado antigua."""
+        vivas = {pista.id for pista in pistas}
+        # Olvidar las pistas que ya no existen para que la caché no crezca
+        for id_pista in list(self._identidades):
+            if id_pista not in vivas:
+                del self._identidades[id_pista]
+        return [pista for pista in pistas
+                if pista.id not in self._identidades or indice - self._identidades[pista.id][1] >= self.intervalo_verificacion]
+
+    def invalidar(self):
+        """Obliga a verificar de nuevo todas las pistas (p. ej. tras cambiar el banco de clientes)."""
+        self._identidades.clear()
+
+    def guardar(self, pista, nombre, indice):
+        self._identidades[pista.id] = (nombre, indice)
+        self.verificaciones += 1
+
+    def nombre(self, pista, defecto="Desconocido"):
+        return self._identidades.get(pista.id, (defecto, None))[0]
+
+
+def agregar_opciones_seguimiento(parser):
+    """Añade a un ArgumentParser las opciones del seguimiento de rostros."""
+    grupo = parser.add_argument_group("seguimiento")
+    grupo.add_argument("--seguimiento", action="store_true", help="Seguir rostros entre detecciones en lugar de detectar en cada fotograma")
+    grupo.add_argument("--intervalo-deteccion", type=int, default=10, help="Fotogramas entre dos detecciones completas")
+    grupo.add_argument("--intervalo-clasificacion", type=int, default=15, help="Fotogramas entre dos clasificaciones de la misma pista")
+
+
+def seguidor_desde_argumentos(args):
+    """Crea el SeguidorRostros pedido en la línea de comandos, o None si no se usa seguimiento."""
+    if not args.seguimiento:
+        return None
+    return SeguidorRostros(args.intervalo_deteccion, args.intervalo_clasificacion)
+
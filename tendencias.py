@@ -0,0 +1,239 @@
+import json
+import math
+import threading
+import time
+
+import numpy as np
+
+from emociones import ETIQUETAS_EMOCION, emociones_traducidas
+
+# Rostros que se guardan como mucho; con 30 fotogramas por segundo y dos rostros cubre más de una hora
+CAPACIDAD_SERIE = 2 ** 18
+
+# Ventanas, en segundos, del resumen (último minuto, últimos 5 minutos y última hora)
+VENTANAS = (60, 300, 3600)
+
+# Constantes de tiempo, en segundos, de las medias móviles exponenciales
+CONSTANTES_EMA = (10.0, 60.0)
+
+# Nombre con el que se agrupan los rostros sin cliente identificado
+SIN_IDENTIFICAR = "Desconocido"
+
+# Terminación del archivo con la instantánea de tendencias que se guarda junto a cada registro de sesión
+EXTENSION_TENDENCIAS = ".tendencias.json"
+
+
+def _texto_distribucion(distribucion, maximo=3):
+    mayores = sorted(distribucion.items(), key=lambda par: par[1], reverse=True)[:maximo]
+    return ", ".join(f"{emocion} {fraccion:.0%}" for emocion, fraccion in mayores if fraccion >= 0.005)
+
+
+def _texto_ventana(segundos):
+    return f"{segundos // 60} min" if segundos % 60 == 0 else f"{segundos} s"
+
+
+class SerieEmociones:
+    """Probabilidades de emoción de los últimos rostros analizados, con memoria constante.
+
+    Cada rostro ocupa una fila de un buffer circular de NumPy (instante, cliente y las 7
+    probabilidades); al llenarse, los más antiguos se sobrescriben. Sobre él se calculan en
+    cualquier momento las distribuciones de las últimas `segundos` por cliente o para todos.
+    Además se mantienen, por cliente y en general, medias móviles exponenciales con las
+    `constantes_ema` dadas, que se actualizan en O(1) con cada lote.
+
+    Los instantes son por defecto los de time.monotonic(), que no retrocede aunque se ajuste la
+    hora del sistema; también vale cualquier reloj que no decrezca, como el tiempo de un video.
+    """
+
+    def __init__(self, capacidad=CAPACIDAD_SERIE, constantes_ema=CONSTANTES_EMA):
+        self.capacidad = capacidad
+        self.constantes_ema = tuple(constantes_ema)
+        self.etiquetas = [emociones_traducidas.get(e, e) for e in ETIQUETAS_EMOCION]
+        self._instantes = np.zeros(capacidad, np.float64)
+        self._clientes = np.zeros(capacidad, np.uint16)
+        self._probabilidades = np.zeros((capacidad, len(ETIQUETAS_EMOCION)), np.float32)
+        self._candado = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._candado:
+            self._siguiente = 0
+            self._ocupadas = 0
+            self._indices_clientes = {SIN_IDENTIFICAR: 0}
+            # Clave None para todos los rostros; el resto, índice de cliente -> (último instante, medias)
+            self._ema = {}
+
+    def _indice_cliente(self, cliente):
+        cliente = cliente or SIN_IDENTIFICAR
+        if cliente not in self._indices_clientes:
+            self._indices_clientes[cliente] = len(self._indices_clientes)
+        return self._indices_clientes[cliente]
+
+    def agregar(self, probabilidades, cliente=None, instante=None):
+        """Añade un rostro; `cliente` es el nombre identificado o None."""
+        self.agregar_lote([probabilidades], [cliente], instante)
+
+    def agregar_lote(self, probabilidades, clientes=None, instante=None):
+        """Añade todos los rostros de un fotograma de una vez."""
+        probabilidades = np.asarray(probabilidades, np.float32).reshape(-1, len(ETIQUETAS_EMOCION))
+        cantidad = len(probabilidades)
+        if not cantidad:
+            return
+        instante = time.monotonic() if instante is None else instante
+        clientes = clientes if clientes is not None else [None] * cantidad
+
+        with self._candado:
+            indices = np.fromiter((self._indice_cliente(c) for c in clientes), np.uint16, cantidad)
+            self._escribir(instante, indices, probabilidades)
+            self._actualizar_ema(None, probabilidades.mean(axis=0), instante)
+            for indice in np.unique(indices):
+                self._actualizar_ema(int(indice), probabilidades[indices == indice].mean(axis=0), instante)
+
+    def agregar_historial(self, instantes, probabilidades, clientes=None):
+        """Añade de una vez rostros con sus propios instantes, no decrecientes (p. ej. los de un análisis ya terminado).
+
+        Equivale a llamar a agregar_lote con los rostros de cada instante, pero sin recorrerlos uno a uno.
+        """
+        instantes = np.asarray(instantes, np.float64).ravel()
+        probabilidades = np.asarray(probabilidades, np.float32).reshape(-1, len(ETIQUETAS_EMOCION))
+        if not len(instantes):
+            return
+        clientes = clientes if clientes is not None else [None] * len(instantes)
+
+        with self._candado:
+            indices = np.fromiter((self._indice_cliente(c) for c in clientes), np.uint16, len(instantes))
+            self._escribir(instantes, indices, probabilidades)
+            self._acumular_ema(None, instantes, probabilidades)
+            for indice in np.unique(indices):
+                seleccion = indices == indice
+                self._acumular_ema(int(indice), instantes[seleccion], probabilidades[seleccion])
+
+    def _escribir(self, instantes, indices, probabilidades):
+        # Si hay más rostros que capacidad sólo caben los últimos
+        cantidad = min(len(indices), self.capacidad)
+        posiciones = (self._siguiente + np.arange(cantidad)) % self.capacidad
+        self._instantes[posiciones] = instantes if np.ndim(instantes) == 0 else instantes[-cantidad:]
+        self._clientes[posiciones] = indices[-cantidad:]
+        self._probabilidades[posiciones] = probabilidades[-cantidad:]
+        self._siguiente = (self._siguiente + cantidad) % self.capacidad
+        self._ocupadas = min(self.capacidad, self._ocupadas + cantidad)
+
+    def _actualizar_ema(self, clave, media, instante):
+        anterior = self._ema.get(clave)
+        if anterior is None:
+            self._ema[clave] = (instante, np.tile(media, (len(self.constantes_ema), 1)))
+            return
+        ultimo, medias = anterior
+        # El peso de la muestra nueva depende del tiempo transcurrido, no del número de fotogramas
+        pesos = np.array([1 - math.exp(-max(0.0, instante - ultimo) / tau) for tau in self.constantes_ema], np.float32)
+        medias += pesos[:, np.newaxis] * (media - medias)
+        self._ema[clave] = (instante, medias)
+
+    def _acumular_ema(self, clave, instantes, probabilidades):
+        """Como _actualizar_ema con la media de cada instante, en orden, pero con operaciones de NumPy."""
+        unicos, grupos = np.unique(instantes, return_inverse=True)
+        medias = np.zeros((len(unicos), probabilidades.shape[1]))
+        np.add.at(medias, grupos, probabilidades)
+        medias /= np.bincount(grupos)[:, np.newaxis]
+        anterior = self._ema.get(clave)
+        if anterior is None:
+            # La primera media inicia las medias móviles
+            anterior = (unicos[0], np.tile(medias[0], (len(self.constantes_ema), 1)))
+        ultimo, iniciales = anterior
+
+        # Cada paso multiplica lo acumulado por exp(-Δt/τ), así que el resultado es una suma ponderada
+        # de todas las medias: la de cada instante pesa 1 - exp(-Δt/τ) por exp(-(tiempo que queda)/τ)
+        pasos = np.diff(np.concatenate(([ultimo], unicos))).clip(0)
+        transcurrido = np.cumsum(pasos)
+        restantes = transcurrido[-1] - transcurrido
+        nuevas = [inicial * math.exp(-transcurrido[-1] / tau) + ((1 - np.exp(-pasos / tau)) * np.exp(-restantes / tau)) @ medias
+                  for inicial, tau in zip(iniciales, self.constantes_ema)]
+        self._ema[clave] = (unicos[-1], np.array(nuevas, np.float32))
+
+    def _ventana(self, segundos, cliente, ahora):
+        """Probabilidades de los rostros de los últimos `segundos` y de `cliente` (o de todos)."""
+        limite = (time.monotonic() if ahora is None else ahora) - segundos
+        # Los instantes no decrecen en orden de escritura: se busca el inicio de la ventana sin recorrer el buffer
+        if self._ocupadas < self.capacidad:
+            tramos = [(0, self._ocupadas)]
+        else:
+            tramos = [(self._siguiente, self.capacidad), (0, self._siguiente)]
+        tramos = [slice(inicio + int(np.searchsorted(self._instantes[inicio:fin], limite)), fin) for inicio, fin in tramos]
+        probabilidades = np.concatenate([self._probabilidades[tramo] for tramo in tramos])
+        if cliente is not None:
+            indice = self._indices_clientes.get(cliente)
+            clientes = np.concatenate([self._clientes[tramo] for tramo in tramos])
+            probabilidades = probabilidades[clientes == indice] if indice is not None else probabilidades[:0]
+        return probabilidades
+
+    def distribucion(self, segundos, cliente=None, ahora=None):
+        """Probabilidad media de cada emoción en los últimos `segundos` (de `cliente` o de todos)."""
+        with self._candado:
+            probabilidades = self._ventana(segundos, cliente, ahora)
+            if not len(probabilidades):
+                return {}
+            medias = probabilidades.mean(axis=0)
+        return dict(zip(self.etiquetas, medias.tolist()))
+
+    def dominantes(self, segundos, cliente=None, ahora=None):
+        """Número de rostros de cada emoción dominante en los últimos `segundos`."""
+        with self._candado:
+            conteo = np.bincount(self._ventana(segundos, cliente, ahora).argmax(axis=1), minlength=len(self.etiquetas))
+        return {etiqueta: n for etiqueta, n in zip(self.etiquetas, conteo.tolist()) if n}
+
+    def ema(self, cliente=None):
+        """Medias móviles exponenciales {constante de tiempo: distribución} de `cliente` o de todos."""
+        with self._candado:
+            clave = None if cliente is None else self._indices_clientes.get(cliente, -1)
+            anterior = self._ema.get(clave)
+            if anterior is None:
+                return {}
+            return {tau: dict(zip(self.etiquetas, medias.tolist())) for tau, medias in zip(self.constantes_ema, anterior[1])}
+
+    def cobertura(self):
+        """Segundos de historia que contiene el buffer (menos que la ventana si se ha llenado antes)."""
+        with self._candado:
+            if not self._ocupadas:
+                return 0.0
+            primero = self._instantes[self._siguiente if self._ocupadas == self.capacidad else 0]
+            return float(self._instantes[self._siguiente - 1] - primero)
+
+    def clientes(self):
+        with self._candado:
+            return list(self._indices_clientes)
+
+    def instantanea(self, ventanas=VENTANAS, ahora=None):
+        """Distribuciones de todas las ventanas, por cliente y en general, y medias móviles; se puede guardar como JSON.
+
+        Las ventanas terminan en `ahora` (por defecto, el momento actual); "instante" es la fecha y hora de la instantánea.
+        """
+        ahora = time.monotonic() if ahora is None else ahora
+        return {
+            "instante": time.time(),
+            "cobertura_s": self.cobertura(),
+            "ventanas": {str(segundos): {"todos": self.distribucion(segundos, ahora=ahora),
+                                         "clientes": {cliente: self.distribucion(segundos, cliente, ahora) for cliente in self.clientes()}}
+                         for segundos in ventanas},
+            "ema": {str(tau): distribucion for tau, distribucion in self.ema().items()},
+        }
+
+    def guardar_json(self, ruta, ventanas=VENTANAS):
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            json.dump(self.instantanea(ventanas), archivo, ensure_ascii=False, indent=2)
+
+    def resumen(self, ventanas=VENTANAS, por_cliente=False):
+        """Texto con las emociones principales de cada ventana y la tendencia reciente."""
+        ahora = time.monotonic()
+        lineas = []
+        for segundos in ventanas:
+            distribucion = self.distribucion(segundos, ahora=ahora)
+            if distribucion:
+                lineas.append(f"Últimos {_texto_ventana(segundos)}: {_texto_distribucion(distribucion)}")
+                if por_cliente:
+                    for cliente in self.clientes():
+                        distribucion = self.distribucion(segundos, cliente, ahora)
+                        if distribucion:
+                            lineas.append(f"  {cliente}: {_texto_distribucion(distribucion)}")
+        for tau, distribucion in self.ema().items():
+            lineas.append(f"Tendencia ({_texto_ventana(int(tau))}): {_texto_distribucion(distribucion)}")
+        return "\n".join(lineas) or "Sin rostros analizados"
@@ -0,0 +1,161 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+from collections import Counter
+
+from analizar import guardar_resultado
+from calidad import agregar_opciones_calidad, filtro_desde_argumentos
+from detectores import agregar_opciones_deteccion, configurar_detector_desde_argumentos
+from inferencia import MOTORES
+from modelos import configurar_carpeta_pesos, configurar_motor
+from motor import listar_videos
+from muestreo import agregar_opciones_muestreo, muestreador_desde_argumentos
+from seguimiento import agregar_opciones_seguimiento, seguidor_desde_argumentos
+from paralelo import inicializar_trabajador, motor_del_proceso
+
+# Registro de trabajos terminados dentro de la carpeta de salida; permite reanudar tras un fallo
+ARCHIVO_ESTADO = "estado.jsonl"
+ARCHIVO_RESUMEN = "resumen_global.json"
+
+
+def leer_manifiesto(ruta):
+    """Lee un manifiesto con una ruta de video por línea (se ignoran vacías y comentarios con #)."""
+    with open(ruta, encoding="utf-8") as archivo:
+        return [linea.strip() for linea in archivo if linea.strip() and not linea.lstrip().startswith("#")]
+
+
+def nombre_resultado(video):
+    """Nombre de archivo de resultado único aunque dos carpetas tengan videos con el mismo nombre."""
+    base = os.path.splitext(os.path.basename(video))[0]
+    huella = hashlib.sha1(os.path.abspath(video).encode("utf-8")).hexdigest()[:8]
+    return f"{base}_{huella}"
+
+
+def _procesar_video(argumentos):
+    """Analiza un video en un proceso trabajador y escribe su archivo de resultado."""
+    video, carpeta_salida, formato, opciones = argumentos
+    try:
+        resultado = motor_del_proceso().analizar(video, **opciones)
+        rutas = guardar_resultado(resultado, carpeta_salida, formato, nombre_resultado(video))
+        return {"video": video, "archivos": rutas, "resumen": resultado.resumen()}
+    except Exception as e:
+        return {"video": video, "error": str(e)}
+
+
+class ColaTrabajos:
+    """Analiza muchos videos con un número limitado de procesos, cada uno con sus modelos ya cargados."""
+
+    def __init__(self, videos, carpeta_salida, concurrencia=None, formato="json", **opciones):
+        # Sin duplicados y conservando el orden de entrada
+        self.videos = list(dict.fromkeys(os.path.abspath(video) for video in videos))
+        self.carpeta_salida = carpeta_salida
+        self.concurrencia = concurrencia or os.cpu_count() or 1
+        self.formato = formato
+        # Opciones para MotorEmociones.analizar (frames_por_lote, muestreador, seguidor...)
+        self.opciones = opciones
+        self.ruta_estado = os.path.join(carpeta_salida, ARCHIVO_ESTADO)
+
+    def completados(self):
+        """Devuelve {video: registro} de los trabajos terminados cuyos archivos siguen existiendo."""
+        completados = {}
+        if not os.path.exists(self.ruta_estado):
+            return completados
+        with open(self.ruta_estado, encoding="utf-8") as archivo:
+            for linea in archivo:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    # Línea a medio escribir si el proceso se interrumpió
+                    continue
+                if "error" not in registro and all(os.path.exists(r) for r in registro["archivos"]):
+                    completados[registro["video"]] = registro
+        return completados
+
+    def ejecutar(self, progreso=print):
+        """Procesa los videos pendientes y escribe el resumen global; devuelve la lista de errores."""
+        os.makedirs(self.carpeta_salida, exist_ok=True)
+        completados = self.completados()
+        pendientes = [video for video in self.videos if video not in completados]
+        progreso(f"{len(completados)} videos ya analizados, {len(pendientes)} pendientes.")
+
+        errores = []
+        if pendientes:
+            argumentos = [(video, self.carpeta_salida, self.formato, self.opciones) for video in pendientes]
+            contexto = multiprocessing.get_context("spawn")
+            with contexto.Pool(min(self.concurrencia, len(pendientes)), initializer=inicializar_trabajador) as pool, \
+                    open(self.ruta_estado, "a", encoding="utf-8") as estado:
+                for i, registro in enumerate(pool.imap_unordered(_procesar_video, argumentos), 1):
+                    # Sólo el proceso principal escribe el estado, una línea por video terminado
+                    estado.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                    estado.flush()
+                    if "error" in registro:
+                        errores.append(registro)
+                        progreso(f"[{i}/{len(pendientes)}] Error en {registro['video']}: {registro['error']}")
+                    else:
+                        completados[registro["video"]] = registro
+                        progreso(f"[{i}/{len(pendientes)}] {registro['video']}")
+
+        self.escribir_resumen(completados, errores)
+        return errores
+
+    def escribir_resumen(self, completados, errores):
+        """Suma los resultados de todos los videos terminados en un único archivo."""
+        total = Counter()
+        fotogramas = 0
+        for registro in completados.values():
+            total.update(registro["resumen"]["resultados"])
+            fotogramas += registro["resumen"]["fotogramas"]
+
+        resumen = {
+            "videos": len(completados),
+            "fotogramas": fotogramas,
+            "resultados": dict(total),
+            "errores": [{"video": e["video"], "error": e["error"]} for e in errores],
+        }
+        with open(os.path.join(self.carpeta_salida, ARCHIVO_RESUMEN), "w", encoding="utf-8") as archivo:
+            json.dump(resumen, archivo, ensure_ascii=False, indent=2)
+        return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cola de análisis de emociones para muchos videos.")
+    parser.add_argument("entradas", nargs="*", help="Archivos de video o carpetas que los contienen")
+    parser.add_argument("-m", "--manifiesto", help="Archivo con una ruta de video por línea")
+    parser.add_argument("-o", "--salida", default="resultados", help="Carpeta de resultados y estado de la cola")
+    parser.add_argument("-f", "--formato", choices=["json", "csv", "ambos", "registro"], default="json")
+    parser.add_argument("-c", "--concurrencia", type=int, default=0, help="Videos analizados a la vez (0 = uno por núcleo)")
+    parser.add_argument("--lote", type=int, default=1, help="Fotogramas cuyos rostros se clasifican en una sola predicción")
+    parser.add_argument("--pesos", help="Carpeta local con los pesos del modelo de emociones (sin conexión)")
+    parser.add_argument("--motor", choices=MOTORES, help="Motor de inferencia del modelo de emociones (por defecto, keras)")
+    parser.add_argument("--modelo-onnx", help="Modelo ONNX para los motores onnx y dnn")
+    agregar_opciones_muestreo(parser)
+    agregar_opciones_seguimiento(parser)
+    agregar_opciones_deteccion(parser)
+    agregar_opciones_calidad(parser)
+    args = parser.parse_args(argv)
+
+    videos = listar_videos(args.entradas)
+    if args.manifiesto:
+        videos += leer_manifiesto(args.manifiesto)
+    if not videos:
+        print("No se encontraron videos para analizar.")
+        return 1
+
+    if args.pesos:
+        # Los procesos trabajadores heredan la carpeta a través del entorno
+        configurar_carpeta_pesos(args.pesos)
+    if args.motor:
+        configurar_motor(args.motor, args.modelo_onnx)
+    configurar_detector_desde_argumentos(args)
+
+    cola = ColaTrabajos(videos, args.salida, args.concurrencia or None, args.formato, frames_por_lote=args.lote,
+                        muestreador=muestreador_desde_argumentos(args), seguidor=seguidor_desde_argumentos(args),
+                        filtro=filtro_desde_argumentos(args))
+    errores = cola.ejecutar()
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
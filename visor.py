@@ -0,0 +1,190 @@
+import argparse
+import os
+import statistics
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+# Refrescos de los que se guardan los tiempos de pintado para las estadísticas
+MUESTRAS_TIEMPO = 300
+
+
+class VisorFotogramas:
+    """Muestra en un lienzo de Tk el último fotograma analizado, a un ritmo máximo fijo.
+
+    Los hilos de análisis sólo dejan el fotograma en una única ranura con `mostrar`; si llega otro
+    antes de pintarlo, el anterior se descarta, de modo que la visualización no retrasa el análisis.
+    El lienzo se refresca desde el hilo de Tk con `after` a `fps_maximo` como mucho, cambiando la
+    imagen de un único elemento del lienzo en lugar de crear uno nuevo por fotograma. `al_pintar`
+    se llama, también desde el hilo de Tk, después de pintar cada fotograma nuevo.
+    """
+
+    def __init__(self, lienzo, fps_maximo=30, bgr=True, al_pintar=None):
+        self.lienzo = lienzo
+        self.intervalo_ms = max(1, round(1000 / fps_maximo))
+        self.bgr = bgr
+        self.al_pintar = al_pintar
+        self._ranura = None
+        self._candado = threading.Lock()
+        self._elemento = None
+        self._foto = None
+        self._programado = None
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.recibidos = 0
+        self.pintados = 0
+        self.tiempos_ms = deque(maxlen=MUESTRAS_TIEMPO)
+
+    def mostrar(self, frame):
+        """Deja `frame` para el próximo refresco; se puede llamar desde cualquier hilo."""
+        with self._candado:
+            self._ranura = frame
+            self.recibidos += 1
+
+    def iniciar(self):
+        """Empieza a refrescar el lienzo (desde el hilo de Tk)."""
+        if self._programado is None:
+            self._refrescar()
+
+    def detener(self):
+        if self._programado is not None:
+            self.lienzo.after_cancel(self._programado)
+            self._programado = None
+
+    def _refrescar(self):
+        # Se programa antes de pintar para mantener el ritmo aunque pintar tarde
+        self._programado = self.lienzo.after(self.intervalo_ms, self._refrescar)
+        with self._candado:
+            frame, self._ranura = self._ranura, None
+        if frame is None:
+            return
+
+        inicio = time.perf_counter()
+        try:
+            self._pintar(frame)
+        except Exception as e:
+            print(f"Error al mostrar el fotograma: {e}")
+            return
+        self.tiempos_ms.append((time.perf_counter() - inicio) * 1000)
+        self.pintados += 1
+        if self.al_pintar is not None:
+            self.al_pintar()
+
+    def _tamano_lienzo(self):
+        # Antes de que la ventana se muestre, winfo_width devuelve 1; se usa el tamaño pedido
+        ancho, alto = self.lienzo.winfo_width(), self.lienzo.winfo_height()
+        if ancho <= 1 or alto <= 1:
+            ancho, alto = int(self.lienzo.cget("width")), int(self.lienzo.cget("height"))
+        return ancho, alto
+
+    def _pintar(self, frame):
+        frame = cv2.resize(frame, self._tamano_lienzo())
+        if self.bgr:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        imagen = Image.fromarray(frame)
+
+        # Con el mismo tamaño se reutiliza la imagen de Tk; sólo se crea otra si cambia el lienzo
+        if self._foto is not None and (self._foto.width(), self._foto.height()) == imagen.size:
+            self._foto.paste(imagen)
+            return
+        self._foto = ImageTk.PhotoImage(imagen)
+        if self._elemento is None:
+            self._elemento = self.lienzo.create_image(0, 0, anchor="nw", image=self._foto)
+        else:
+            self.lienzo.itemconfigure(self._elemento, image=self._foto)
+
+    def estadisticas(self):
+        tiempos = sorted(self.tiempos_ms)
+        return {
+            "fotogramas_recibidos": self.recibidos,
+            "fotogramas_pintados": self.pintados,
+            "fotogramas_descartados": max(0, self.recibidos - self.pintados),
+            "pintado_medio_ms": statistics.fmean(tiempos) if tiempos else 0.0,
+            "pintado_p95_ms": tiempos[int(len(tiempos) * 0.95)] if tiempos else 0.0,
+        }
+
+
+def memoria_mb():
+    """Memoria residente del proceso en MB, o None si no se puede medir en este sistema."""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def main(argv=None):
+    import tkinter as tk
+
+    parser = argparse.ArgumentParser(description="Prueba de resistencia del visor: memoria y tiempo de pintado durante una sesión larga.")
+    parser.add_argument("-d", "--duracion", type=float, default=3600, help="Segundos de prueba")
+    parser.add_argument("--fps-analisis", type=float, default=60, help="Fotogramas por segundo que entrega el hilo de análisis simulado")
+    parser.add_argument("--fps-maximo", type=float, default=30, help="Fotogramas por segundo máximos del visor")
+    parser.add_argument("--resolucion", default="1280x720", help="Tamaño de los fotogramas simulados")
+    parser.add_argument("--informe", type=float, default=60, help="Segundos entre informes")
+    parser.add_argument("--crecimiento-maximo", type=float, default=20, help="MB que puede crecer la memoria desde el primer informe")
+    args = parser.parse_args(argv)
+
+    ancho, alto = (int(valor) for valor in args.resolucion.split("x"))
+    ventana = tk.Tk()
+    ventana.title("Prueba del visor")
+    lienzo = tk.Canvas(ventana, width=640, height=360, bg="black")
+    lienzo.pack(fill=tk.BOTH, expand=True)
+    visor = VisorFotogramas(lienzo, args.fps_maximo)
+    detenido = threading.Event()
+
+    def analizar():
+        # Fotogramas con contenido que cambia y un rectángulo, como los que dibuja el análisis
+        base = np.random.default_rng(0).integers(0, 256, (alto, ancho, 3), dtype=np.uint8)
+        indice = 0
+        while not detenido.is_set():
+            frame = np.roll(base, indice * 8, axis=1)
+            cv2.rectangle(frame, (100, 100), (300, 300), (0, 255, 0), 2)
+            cv2.putText(frame, str(indice), (110, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+            visor.mostrar(frame)
+            indice += 1
+            time.sleep(1 / args.fps_analisis)
+
+    inicio = time.monotonic()
+    memorias = []
+
+    def informar():
+        estadisticas = visor.estadisticas()
+        memoria = memoria_mb()
+        memorias.append(memoria)
+        print(f"{time.monotonic() - inicio:7.0f} s: memoria {memoria or 0:.1f} MB, elementos del lienzo {len(lienzo.find_all())}, "
+              f"pintado {estadisticas['pintado_medio_ms']:.2f} ms (p95 {estadisticas['pintado_p95_ms']:.2f} ms), "
+              f"{estadisticas['fotogramas_pintados']} pintados, {estadisticas['fotogramas_descartados']} descartados")
+        if time.monotonic() - inicio >= args.duracion:
+            detenido.set()
+            ventana.destroy()
+        else:
+            ventana.after(int(args.informe * 1000), informar)
+
+    threading.Thread(target=analizar, daemon=True).start()
+    visor.iniciar()
+    ventana.after(int(args.informe * 1000), informar)
+    ventana.mainloop()
+
+    memorias = [memoria for memoria in memorias if memoria is not None]
+    if len(memorias) < 2:
+        print("No hay suficientes medidas de memoria para comparar")
+        return 0
+    crecimiento = max(memorias) - memorias[0]
+    print(f"Crecimiento de memoria: {crecimiento:.1f} MB (máximo permitido {args.crecimiento_maximo:.0f} MB)")
+    return 0 if crecimiento <= args.crecimiento_maximo else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())